@@ -3,12 +3,14 @@ import re
 import io
 import sys
 import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime, date
 from urllib.parse import unquote, urlparse
 
 
 
 import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
 import pyodbc
 from bs4 import BeautifulSoup
@@ -34,6 +36,30 @@ SQL_SCHEMA   = os.getenv("SQL_SCHEMA",   "dbo")
 SQL_TABLE_BASE    = os.getenv("SQL_TABLE",    "address_list")
 SQL_TABLE    = f"{SQL_TABLE_BASE}_{today_str}"
 
+# Company lists published on TARGET_PAGE: key -> link pattern + output table base name.
+# Each list lands in {table_base}_{MMDDYYYY}; only 'required' lists fail the run when missing.
+LIST_CATALOG = {
+    "licensed_or_approved": {
+        "pattern": XLS_NAME_PATTERN,
+        "table_base": SQL_TABLE_BASE,
+        "required": True,
+    },
+    "surplus_lines": {
+        "pattern": re.compile(r"Surplus\s+Lines.*\.xlsx?", re.I),
+        "table_base": "address_list_surplus_lines",
+        "required": False,
+    },
+    "risk_retention_groups": {
+        "pattern": re.compile(r"Risk\s+Retention\s+Groups?.*\.xlsx?", re.I),
+        "table_base": "address_list_risk_retention",
+        "required": False,
+    },
+}
+# Comma-separated catalog keys to pull, e.g. "licensed_or_approved,surplus_lines"
+ENABLED_LISTS = [k.strip() for k in os.getenv("MA_ADDRLIST_LISTS", ",".join(LIST_CATALOG)).split(",") if k.strip()]
+DOWNLOAD_WORKERS = int(os.getenv("MA_ADDRLIST_DOWNLOAD_WORKERS", "4"))
+PARSE_WORKERS    = int(os.getenv("MA_ADDRLIST_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
 ODBC_DRIVER  = os.getenv("ODBC_DRIVER", "ODBC Driver 17 for SQL Server")  # or 18
 TRUSTED_CONN = os.getenv("TRUSTED_CONN", "1") not in ("0", "false", "False")
 SQL_USER     = os.getenv("SQL_USER")
@@ -72,32 +98,74 @@ def get_sql_connection():
         )
     return pyodbc.connect(conn_str, autocommit=True)
 
-def find_xls_url() -> str:
-    """Find the 'Massachusetts Licensed Or Approved Companies.xls' link on the page."""
+def get_http_session() -> requests.Session:
+    """One pooled session shared by the page request and all workbook downloads."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=max(DOWNLOAD_WORKERS, 1))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def absolutize_href(href: str) -> str:
+    if href.startswith("//"):
+        return "https:" + href
+    if href.startswith("/"):
+        return "https://www.mass.gov" + href
+    return href
+
+def find_xls_urls(session: requests.Session, list_keys) -> dict:
+    """Return {list key: URL} for every catalog list found on the page (first matching link wins)."""
     log.info("Requesting Mass.gov listing page…")
-    r = requests.get(TARGET_PAGE, timeout=60)
+    r = session.get(TARGET_PAGE, timeout=60)
     r.raise_for_status()
     soup = BeautifulSoup(r.text, "lxml")
 
+    urls = {}
     for a in soup.find_all("a", href=True):
         text = (a.get_text() or "").strip()
         href = a["href"]
-        if XLS_NAME_PATTERN.search(text) or XLS_NAME_PATTERN.search(href):
-            if href.startswith("//"):
-                href = "https:" + href
-            elif href.startswith("/"):
-                href = "https://www.mass.gov" + href
-            log.info(f"Found XLS link: {text} -> {href}")
-            return href
-
-    raise RuntimeError("Could not find the 'Massachusetts Licensed Or Approved Companies.xls' link.")
-
-def download_file(url: str) -> bytes:
-    log.info("Downloading XLS/XLSX file…")
-    r = requests.get(url, timeout=120)
+        for key in list_keys:
+            if key in urls:
+                continue
+            pattern = LIST_CATALOG[key]["pattern"]
+            if pattern.search(text) or pattern.search(href):
+                urls[key] = absolutize_href(href)
+                log.info(f"Found XLS link for '{key}': {text} -> {urls[key]}")
+
+    for key in list_keys:
+        if key not in urls:
+            if LIST_CATALOG[key]["required"]:
+                raise RuntimeError(f"Could not find the '{key}' link ({LIST_CATALOG[key]['pattern'].pattern}).")
+            log.warning(f"No link found for optional list '{key}'; skipping.")
+    return urls
+
+def download_file(url: str, session: requests.Session | None = None) -> bytes:
+    log.info(f"Downloading XLS/XLSX file {url}…")
+    r = (session or requests).get(url, timeout=120)
     r.raise_for_status()
     return r.content
 
+def collect_results(futures: dict, stage: str) -> dict:
+    """
+    Waits on {list key: future}. A failure on a required list fails the run;
+    an optional list that fails is logged and left out of the result.
+    """
+    results = {}
+    for key, fut in futures.items():
+        try:
+            results[key] = fut.result()
+        except Exception as e:
+            if LIST_CATALOG[key]["required"]:
+                raise RuntimeError(f"{stage} failed for required list '{key}': {e}") from e
+            log.warning(f"{stage} failed for optional list '{key}'; skipping: {e}")
+    return results
+
+def download_files(session: requests.Session, urls: dict) -> dict:
+    """Download all workbooks concurrently over the shared session; returns {list key: bytes}."""
+    with ThreadPoolExecutor(max_workers=max(DOWNLOAD_WORKERS, 1)) as pool:
+        futures = {key: pool.submit(download_file, url, session) for key, url in urls.items()}
+        return collect_results(futures, "Download")
+
 def derive_download_filename(source_url: str, file_bytes: bytes) -> str:
     """Return a sanitized filename with the download date appended."""
     parsed = urlparse(source_url)
@@ -228,12 +296,18 @@ def load_table_dataframe(xbytes: bytes) -> pd.DataFrame:
 
     return df
 
-def recreate_table(conn):
+def parse_workbook(xbytes: bytes):
+    """Worker-pool entry point: return (update_dt, cleaned DataFrame) for one workbook."""
+    update_dt = read_update_date_from_b4(xbytes)
+    df = clean_and_trim(load_table_dataframe(xbytes))
+    return update_dt, df
+
+def recreate_table(conn, table: str = SQL_TABLE):
     ddl = f"""
-    IF OBJECT_ID('{SQL_SCHEMA}.{SQL_TABLE}', 'U') IS NOT NULL
-        DROP TABLE {SQL_SCHEMA}.{SQL_TABLE};
+    IF OBJECT_ID('{SQL_SCHEMA}.{table}', 'U') IS NOT NULL
+        DROP TABLE {SQL_SCHEMA}.{table};
 
-    CREATE TABLE {SQL_SCHEMA}.{SQL_TABLE}(
+    CREATE TABLE {SQL_SCHEMA}.{table}(
         company_type  VARCHAR(150)  NULL,
         naic          VARCHAR(20)   NULL,
         company       VARCHAR(255)  NULL,
@@ -285,7 +359,7 @@ def clean_and_trim(df: pd.DataFrame) -> pd.DataFrame:
 
 
 
-def insert_dataframe(conn, df: pd.DataFrame, update_dt_val):
+def insert_dataframe(conn, df: pd.DataFrame, update_dt_val, table: str = SQL_TABLE):
     """Bulk insert rows; append update_dt if not present."""
     cols = ["company_type","naic","company","address","city","state","zip","phone","update_dt"]
     for c in cols:
@@ -300,38 +374,52 @@ def insert_dataframe(conn, df: pd.DataFrame, update_dt_val):
     df = df.replace({"nan": None, "NaN": None})
 
     placeholders = ", ".join(["?"] * len(cols))
-    sql = f"INSERT INTO {SQL_SCHEMA}.{SQL_TABLE} ({', '.join(cols)}) VALUES ({placeholders})"
+    sql = f"INSERT INTO {SQL_SCHEMA}.{table} ({', '.join(cols)}) VALUES ({placeholders})"
 
     with conn.cursor() as cur:
         cur.fast_executemany = True
         cur.executemany(sql, df.values.tolist())
 
-    log.info(f"Inserted {len(df)} rows into {SQL_SCHEMA}.{SQL_TABLE}.")
+    log.info(f"Inserted {len(df)} rows into {SQL_SCHEMA}.{table}.")
 
 # =====
 # Main
 # =====
 def main():
     try:
-        xls_url = find_xls_url()
-        file_bytes = download_file(xls_url)
-        archive_downloaded_file(file_bytes, xls_url)
-
-        update_dt = read_update_date_from_b4(file_bytes)
-        if update_dt:
-            log.info(f"Update date (B4): {update_dt.isoformat()}")
-        else:
-            log.warning("Could not read update date from B4; leaving update_dt as NULL.")
-
-        df = load_table_dataframe(file_bytes)
-        df = clean_and_trim(df) 
-        # ensure column present even if None (insert_dataframe also protects)
-        if "update_dt" not in df.columns:
-            df["update_dt"] = update_dt
+        unknown = [k for k in ENABLED_LISTS if k not in LIST_CATALOG]
+        if unknown:
+            raise RuntimeError(f"Unknown list(s) in MA_ADDRLIST_LISTS: {', '.join(unknown)}")
+
+        # Fetch: one page request, then every workbook concurrently over one pooled session
+        with get_http_session() as session:
+            urls = find_xls_urls(session, ENABLED_LISTS)
+            files = download_files(session, urls)
+
+        for key, file_bytes in files.items():
+            archive_downloaded_file(file_bytes, urls[key])
+
+        # Parse: openpyxl/xlrd are CPU-bound, so workbooks are parsed in separate processes
+        with ProcessPoolExecutor(max_workers=max(min(PARSE_WORKERS, len(files)), 1)) as pool:
+            futures = {key: pool.submit(parse_workbook, file_bytes) for key, file_bytes in files.items()}
+            parsed = collect_results(futures, "Parse")
 
+        # Publish: one table per list
         conn = get_sql_connection()
-        recreate_table(conn)
-        insert_dataframe(conn, df, update_dt)
+        for key in parsed:
+            update_dt, df = parsed[key]
+            table = f"{LIST_CATALOG[key]['table_base']}_{today_str}"
+            if update_dt:
+                log.info(f"[{key}] Update date (B4): {update_dt.isoformat()}")
+            else:
+                log.warning(f"[{key}] Could not read update date from B4; leaving update_dt as NULL.")
+
+            # ensure column present even if None (insert_dataframe also protects)
+            if "update_dt" not in df.columns:
+                df["update_dt"] = update_dt
+
+            recreate_table(conn, table)
+            insert_dataframe(conn, df, update_dt, table)
 
         log.info("All done ✅")
     except Exception as e:
@@ -3,9 +3,19 @@ import re
 import io
 import sys
 import logging
+import json
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date
+from dataclasses import dataclass, field
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 import requests
+import numpy as np
 import pandas as pd
 import pyodbc
 from bs4 import BeautifulSoup
@@ -29,9 +39,33 @@ SQL_SCHEMA   = os.getenv("SQL_SCHEMA",   "dbo")
 
 # --- Part 2 (Mapping) ---
 SQL_MAPPING_TABLE = "MA_2A_Form_Mapping"
+SQL_MANUAL_MAPPING_TABLE = "MA_2A_Form_Manual_Mapping"
+# Persistent name -> ID table behind the published rmv_name_id / mass_gov_name_id (append-only)
+SQL_NAME_DICTIONARY_TABLE = "MA_2A_Form_Name_Dictionary"
+# Optional CSV/XLSX of manual mappings to bulk upsert before the mapping runs
+MANUAL_MAPPING_FILE = os.getenv("MANUAL_MAPPING_FILE")
 RMV_SOURCE_DB = "CO1SQLWPV10_EnterpriseServices"   # Database where RMV_CARRIER_NAME table lives, if using NE server it's CO1SQLWPV10, if using AE1SQLWPV20 server it's CO1SQLWPV10_EnterpriseServices
 RMV_SOURCE_TABLE = "EnterpriseServices.[dbo].[RMV_CARRIER_NAME]"
 
+# --- Streaming Mode (--stream-batch-size) ---
+# >0 reads RMV names in batches of this size and streams results to SQL; 0 = load everything in memory
+RMV_STREAM_BATCH_SIZE = int(os.getenv("RMV_STREAM_BATCH_SIZE", "0"))
+
+# --- Fuzzy Matching (--fuzzy-engine / --compare-engines) ---
+FUZZY_ENGINE     = os.getenv("FUZZY_ENGINE", "none")  # none | levenshtein_jaccard | tfidf
+# Each engine scores on its own scale, so each has its own cut-off
+FUZZY_THRESHOLD  = float(os.getenv("FUZZY_THRESHOLD", "0.78"))  # levenshtein_jaccard: same cut-off as the SQL fuzzy script
+# tfidf cosine: conservative starting point; tune with --compare-engines against the manual mappings (readme 4.12)
+FUZZY_TFIDF_THRESHOLD = float(os.getenv("FUZZY_TFIDF_THRESHOLD", "0.90"))
+FUZZY_TOP_K      = int(os.getenv("FUZZY_TOP_K", "5"))
+FUZZY_THREADS    = int(os.getenv("FUZZY_THREADS", str(min(8, os.cpu_count() or 1))))
+FUZZY_BLOCK_ROWS = int(os.getenv("FUZZY_BLOCK_ROWS", "2000"))  # RMV rows per sparse multiply
+
+# --- Daemon Mode (--daemon) ---
+DAEMON_POLL_SECONDS = int(os.getenv("DAEMON_POLL_SECONDS", "900"))
+DAEMON_HEALTH_HOST  = os.getenv("DAEMON_HEALTH_HOST", "127.0.0.1")
+DAEMON_HEALTH_PORT  = int(os.getenv("DAEMON_HEALTH_PORT", "8085"))  # 0 disables the health endpoint
+
 # --- Connection ---
 ODBC_DRIVER  = os.getenv("ODBC_DRIVER", "ODBC Driver 17 for SQL Server")
 # TRUSTED_CONN=1 uses Windows Auth (Trusted_Connection=yes)
@@ -62,17 +96,24 @@ STOPWORDS = {
     'THE'
 }
 
+_PUNCT_RE = re.compile(r'[.,\'"/\\()[\]{}:-]')
+_SPACE_RE = re.compile(r'\s+')
+
 def normalize_name(s: str) -> str | None:
     """
     Translates the dbo.NormalizeInsName SQL function to Python.
     """
     if not s or pd.isna(s):
         return None
+    return _normalize_str(str(s))
 
-    x = str(s).upper()
+@lru_cache(maxsize=65536)
+def _normalize_str(x: str) -> str | None:
+    # Cached: the same carrier names come back on every run (and every poll in daemon mode)
+    x = x.upper()
     x = x.replace('&', ' AND ')
-    x = re.sub(r'[.,\'"/\\()[\]{}:-]', ' ', x)
-    x = re.sub(r'\s+', ' ', x).strip()
+    x = _PUNCT_RE.sub(' ', x)
+    x = _SPACE_RE.sub(' ', x).strip()
     
     if x.startswith('THE '):
         x = x[4:].lstrip()
@@ -93,9 +134,432 @@ def normalize_name(s: str) -> str | None:
         else:
             break
 
-    x = re.sub(r'\s+', ' ', x).strip()
+    x = _SPACE_RE.sub(' ', x).strip()
     return x if x else None
 
+# =========================
+# Override Rules
+# =========================
+
+# 1. Pattern Match: XXXX(Pilgrim) -> Pilgrim Insurance Company
+PILGRIM_PATTERN = re.compile(r'\(Pilgrim\)', re.I)
+PILGRIM_TARGET = 'Pilgrim Insurance Company'
+
+# 2. Exact Name Overrides
+NAME_OVERRIDES = {
+    # Original overrides
+    'Privilege Underwriters Reciprocal Exchange (PURE)': 'Privilege Underwriters Reciprocal Exchange',
+    'Metropolitan Property and Casualty Insurance Company': 'Farmers Casualty Insurance Company',
+    'Electric Insurance Company': 'Plymouth Rock Assurance Corporation',
+
+    'Foremost Insurance Company': 'Foremost Property and Casualty Insurance Company',
+    'Citation Insurance Company, MA': 'Citation Insurance Company',
+    'IDS Property Casualty Insurance Company': 'American Family Connect Insurance Company',
+    'Seaworthy Insurance Company': 'GEICO Marine Insurance Company'
+}
+
+
+# =========================
+# Source Configuration
+# =========================
+
+# Source header -> canonical column, for the Mass Gov workbook
+MA_HEADER_ALIASES = {
+    "Company Type": "company_type", "NAIC #": "naic", "Company": "company",
+    "Address": "address", "City": "city", "State": "state", "Zip": "zip", "Phone": "phone",
+}
+
+SOURCE_REQUIRED_KEYS = ("name", "target_page", "link_pattern", "base_url", "mapping_table", "carrier_source")
+
+@dataclass
+class SourceConfig:
+    """
+    Everything that is specific to one state's company list. The normalization,
+    matching and publishing code is shared; adding a state is a new SourceConfig.
+    """
+    name: str                            # short key used in logs/telemetry, e.g. "MA"
+    target_page: str                     # page that links to the company list workbook
+    link_pattern: re.Pattern             # matched against link text or href
+    base_url: str                        # prefix for site-relative links
+    header_aliases: dict                 # workbook header -> canonical column (also drives header detection)
+    company_type_filter: str | None      # keep rows whose company_type contains this; None keeps all
+    mapping_table: str
+    manual_mapping_table: str
+    name_dictionary_table: str           # stable IDs for the published names (never dropped)
+    carrier_source: str                  # fully-qualified table with a CARRIER_NAME column
+    archive_folder: str
+    archive_prefix: str
+    # (regex, target) pairs: matching carrier names are matched as `target` but keep their own name
+    # as mass_gov_name (e.g. "XXXX (Pilgrim)" rows take Pilgrim's address)
+    pattern_overrides: tuple = ()
+    name_overrides: dict = field(default_factory=dict)  # exact carrier name -> list company name
+
+    @property
+    def manual_stage_table(self) -> str:
+        return f"{self.manual_mapping_table}_Stage"
+
+    @property
+    def mapping_stage_table(self) -> str:
+        return f"{self.mapping_table}_Stage"
+
+    @property
+    def name_dictionary_stage_table(self) -> str:
+        return f"{self.name_dictionary_table}_Stage"
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "SourceConfig":
+        """Builds a source from JSON-style config; regexes are given as strings (case-insensitive)."""
+        d = dict(d)
+        # carrier_source has no default: falling back to the MA RMV table would silently
+        # match Massachusetts carriers against another state's list
+        missing = [k for k in SOURCE_REQUIRED_KEYS if not d.get(k)]
+        if missing:
+            raise RuntimeError(f"Source config {d.get('name', '?')!r} is missing required key(s): {', '.join(missing)}")
+        aliased = set(d.get("header_aliases", MA_HEADER_ALIASES).values())
+        needed = ["company"] + (["company_type"] if d.get("company_type_filter") else [])
+        unmapped = [c for c in needed if c not in aliased]
+        if unmapped:
+            raise RuntimeError(f"Source config {d['name']!r} header_aliases map nothing to: {', '.join(unmapped)}")
+        d["link_pattern"] = re.compile(d["link_pattern"], re.I)
+        d["pattern_overrides"] = tuple((re.compile(p, re.I), t) for p, t in d.get("pattern_overrides", ()))
+        d.setdefault("header_aliases", MA_HEADER_ALIASES)
+        d.setdefault("company_type_filter", None)
+        d.setdefault("archive_folder", ARCHIVE_FOLDER)
+        d.setdefault("archive_prefix", f"{d['name']}_Licensed_Companies")
+        d.setdefault("manual_mapping_table", f"{d['mapping_table']}_Manual")
+        d.setdefault("name_dictionary_table", f"{d['mapping_table']}_Name_Dictionary")
+        return cls(**d)
+
+MA_SOURCE = SourceConfig(
+    name="MA",
+    target_page=TARGET_PAGE,
+    link_pattern=XLS_NAME_PATTERN,
+    base_url="https://www.mass.gov",
+    header_aliases=MA_HEADER_ALIASES,
+    company_type_filter="Property & Casualty",
+    mapping_table=SQL_MAPPING_TABLE,
+    manual_mapping_table=SQL_MANUAL_MAPPING_TABLE,
+    name_dictionary_table=SQL_NAME_DICTIONARY_TABLE,
+    carrier_source=f"{RMV_SOURCE_DB}.{RMV_SOURCE_TABLE}",
+    archive_folder=ARCHIVE_FOLDER,
+    archive_prefix="MA_Licensed_Companies",
+    pattern_overrides=((PILGRIM_PATTERN, PILGRIM_TARGET),),
+    name_overrides=NAME_OVERRIDES,
+)
+
+
+# =========================
+# Name Dictionary
+# =========================
+class Interner:
+    """Maps hashable values to dense integer IDs; None/NaN map to -1."""
+
+    def __init__(self):
+        self._ids = {}
+        self.next_id = 0
+
+    def intern(self, value) -> int:
+        i = self._ids.get(value)
+        if i is None:
+            i = self.next_id
+            self._ids[value] = i
+            self.next_id += 1
+        return i
+
+    def get(self, value) -> int:
+        return self._ids.get(value, -1)
+
+    def encode(self, values, key=None) -> np.ndarray:
+        """Interns each distinct value once and returns an int64 ID per input value."""
+        codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+        if len(uniques) == 0:
+            return np.full(len(codes), -1, dtype=np.int64)
+        ids = np.fromiter(
+            (self.intern(u if key is None else key(u)) for u in uniques),
+            dtype=np.int64,
+            count=len(uniques),
+        )
+        return np.where(codes >= 0, ids[codes], -1)
+
+    def copy(self, next_id: int | None = None) -> "Interner":
+        """Copies the vocabulary; next_id lets new IDs continue after another copy's."""
+        other = Interner()
+        other._ids = dict(self._ids)
+        other.next_id = max(self.next_id, next_id or 0)
+        return other
+
+    def __len__(self):
+        return len(self._ids)
+
+class NameDictionary:
+    """
+    Interns raw names, normalized names and token sets into integer IDs once per run,
+    so every match pass joins and filters on int64 arrays instead of strings.
+    """
+
+    def __init__(self):
+        self.names = Interner()       # raw + normalized names share one ID space
+        self.tokens = Interner()
+        self.token_sets = Interner()  # sorted tuple of token IDs -> ID
+
+    def encode_names(self, values) -> np.ndarray:
+        return self.names.encode(values)
+
+    def encode_token_sets(self, normalized_values) -> np.ndarray:
+        return self.token_sets.encode(normalized_values, key=self._token_set_key)
+
+    def _token_set_key(self, normalized: str) -> tuple:
+        return tuple(sorted({self.tokens.intern(t) for t in normalized.split(' ')}))
+
+    def copy(self, next_name_id: int | None = None) -> "NameDictionary":
+        other = NameDictionary()
+        other.names = self.names.copy(next_name_id)
+        other.tokens = self.tokens.copy()
+        other.token_sets = self.token_sets.copy()
+        return other
+
+class MassGovIndex:
+    """The filtered Mass Gov rows plus the dictionary their name IDs were interned into."""
+
+    def __init__(self, df: pd.DataFrame, names: NameDictionary):
+        self.df = df
+        self.names = names
+        self._fuzzy_targets = None
+        self._tfidf_matcher = None
+
+    @property
+    def fuzzy_targets(self) -> pd.DataFrame:
+        """One row per distinct normalized name (first row wins): the candidate set for fuzzy engines."""
+        if self._fuzzy_targets is None:
+            df = self.df[(self.df['normalized_id'] >= 0) & (self.df['company_id'] >= 0)]
+            self._fuzzy_targets = df.drop_duplicates(subset=['normalized_id']).reset_index(drop=True)
+        return self._fuzzy_targets
+
+    def tfidf_matcher(self) -> "TfidfTrigramMatcher":
+        """Built on first use and then kept with the index (warm across daemon runs)."""
+        if self._tfidf_matcher is None:
+            self._tfidf_matcher = TfidfTrigramMatcher(self.fuzzy_targets['normalized_name'].tolist())
+        return self._tfidf_matcher
+
+    def __len__(self):
+        return len(self.df)
+
+
+# =========================
+# Fuzzy Engines
+# =========================
+def levenshtein(a: str, b: str) -> int:
+    """Edit distance (same result as dbo.Levenshtein), two-row DP."""
+    if len(a) < len(b):
+        a, b = b, a
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+def _candidates_frame(records: list) -> pd.DataFrame:
+    df = pd.DataFrame(records, columns=['query_idx', 'mass_idx', 'rank', 'score'])
+    return df.astype({'query_idx': 'int64', 'mass_idx': 'int64', 'rank': 'int64', 'score': 'float64'})
+
+def match_levenshtein_jaccard(queries: list, mass_index: "MassGovIndex", top_k: int):
+    """
+    Python port of levenshtein_jaccard_fuzzy_match.sql: block on first letter and
+    a +/-10 length window, then score 0.7 * token Jaccard + 0.3 * (1 - lev / avg length).
+    Pairs with no shared token are dropped, as in the SQL (inner join on tokens).
+    Returns (candidates [query_idx, mass_idx, rank, score], pairs scored).
+    """
+    blocks = {}
+    for mass_idx, name in enumerate(mass_index.fuzzy_targets['normalized_name']):
+        blocks.setdefault(name[0], []).append((mass_idx, name, set(name.split(' '))))
+
+    records = []
+    n_pairs = 0
+    for query_idx, q in enumerate(queries):
+        if not q:
+            continue
+        q_tokens = set(q.split(' '))
+        scored = []
+        for mass_idx, name, tokens in blocks.get(q[0], ()):
+            if abs(len(q) - len(name)) > 10:
+                continue
+            n_pairs += 1
+            inter = len(q_tokens & tokens)
+            if inter == 0:
+                continue
+            jaccard = inter / (len(q_tokens) + len(tokens) - inter)
+            lev_sim = 1.0 - levenshtein(q, name) / ((len(q) + len(name)) / 2.0)
+            scored.append((jaccard * 0.7 + lev_sim * 0.3, mass_idx))
+        scored.sort(key=lambda t: (-t[0], t[1]))
+        records.extend((query_idx, mass_idx, rank, score) for rank, (score, mass_idx) in enumerate(scored[:top_k]))
+
+    return _candidates_frame(records), n_pairs
+
+class TfidfTrigramMatcher:
+    """
+    Character-trigram TF-IDF over the normalized Mass Gov names. Queries are
+    scored with one sparse matrix multiply per block of rows, so only pairs
+    sharing a trigram are ever touched. Top-k selection is a vectorized sort
+    per block. Blocks run on a thread pool: the sparse multiply and the sort
+    release the GIL, but building each block's DataFrame does not, so the
+    speed-up from extra threads is partial.
+    """
+
+    def __init__(self, mass_names: list):
+        from scipy import sparse  # only needed for this engine
+
+        self._sparse = sparse
+        self.trigrams = Interner()
+        tf = self._term_frequencies(mass_names, add=True)
+        doc_freq = np.bincount(tf.indices, minlength=tf.shape[1])
+        self.idf = np.log((1.0 + len(mass_names)) / (1.0 + doc_freq)) + 1.0
+        self.mass_matrix_t = self._weight(tf).T.tocsr()  # vocab x n_mass
+
+    @staticmethod
+    def _trigrams(name: str):
+        padded = f" {name} "
+        return (padded[i:i + 3] for i in range(len(padded) - 2))
+
+    def _term_frequencies(self, names: list, add: bool):
+        rows, cols = [], []
+        lookup = self.trigrams.intern if add else self.trigrams.get
+        for row, name in enumerate(names):
+            if not name:
+                continue
+            for gram in self._trigrams(name):
+                col = lookup(gram)
+                if col >= 0:  # unseen query trigrams cannot match anything
+                    rows.append(row)
+                    cols.append(col)
+        tf = self._sparse.csr_matrix(
+            (np.ones(len(rows)), (rows, cols)),
+            shape=(len(names), len(self.trigrams)),
+        )
+        tf.sum_duplicates()
+        return tf
+
+    def _weight(self, tf):
+        """TF-IDF weights, L2-normalized per row (so a dot product is the cosine)."""
+        tf = tf.multiply(self.idf[np.newaxis, :tf.shape[1]]).tocsr()
+        norms = np.sqrt(np.asarray(tf.multiply(tf).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        return self._sparse.diags(1.0 / norms) @ tf
+
+    def query(self, names: list, top_k: int, threads: int = 1, block_rows: int = 2000):
+        """Returns (candidates [query_idx, mass_idx, rank, score], pairs scored)."""
+        q = self._weight(self._term_frequencies(names, add=False)).tocsr()
+
+        def score_block(start):
+            sims = (q[start:start + block_rows] @ self.mass_matrix_t).tocsr()
+            sims.sort_indices()
+            counts = np.diff(sims.indptr)
+            rows = np.repeat(np.arange(sims.shape[0]), counts)
+            # One stable argsort orders every row's candidates by score desc, mass_idx asc
+            # (cosines are in [0, 1], so row - score / 2 never crosses into the next row).
+            # The rows keep their CSR layout, so the rank is the offset from the row's start.
+            order = np.argsort(rows - 0.5 * sims.data, kind='stable')
+            rank = np.arange(len(order)) - np.repeat(sims.indptr[:-1], counts)
+            keep = rank < top_k
+            order = order[keep]
+            block = pd.DataFrame({
+                'query_idx': start + rows[order],
+                'mass_idx': sims.indices[order],
+                'rank': rank[keep],
+                'score': sims.data[order],
+            })
+            return block, sims.nnz
+
+        with ThreadPoolExecutor(max_workers=max(threads, 1)) as pool:
+            results = list(pool.map(score_block, range(0, q.shape[0], block_rows)))
+
+        if not results:
+            return _candidates_frame([]), 0
+        cands = pd.concat([block for block, _ in results], ignore_index=True)
+        n_pairs = sum(nnz for _, nnz in results)
+        return _candidates_frame(cands), n_pairs
+
+def match_tfidf(queries: list, mass_index: "MassGovIndex", top_k: int):
+    return mass_index.tfidf_matcher().query(queries, top_k, FUZZY_THREADS, FUZZY_BLOCK_ROWS)
+
+# engine name -> (candidate function, match_method label, minimum score on that engine's scale)
+FUZZY_ENGINES = {
+    "levenshtein_jaccard": (match_levenshtein_jaccard, "FUZZY_LEV_JACCARD", FUZZY_THRESHOLD),
+    "tfidf": (match_tfidf, "FUZZY_TFIDF", FUZZY_TFIDF_THRESHOLD),
+}
+
+def match_fuzzy(df_rmv: pd.DataFrame, mass_index: "MassGovIndex", engine: str) -> pd.DataFrame:
+    """Pass 4: best fuzzy candidate per RMV name, kept if its score >= the engine's threshold."""
+    candidate_fn, method, threshold = FUZZY_ENGINES[engine]
+    t0 = time.perf_counter()
+    cands, n_pairs = candidate_fn(df_rmv['normalized_name'].tolist(), mass_index, 1)
+    best = cands[(cands['rank'] == 0) & (cands['score'] >= threshold)]
+
+    df_matches = pd.concat([
+        df_rmv.iloc[best['query_idx'].to_numpy()][['CARRIER_NAME', 'rmv_name_id']].reset_index(drop=True),
+        mass_index.fuzzy_targets.iloc[best['mass_idx'].to_numpy()].reset_index(drop=True),
+    ], axis=1)
+    df_matches['match_method'] = method
+    df_matches['match_score'] = best['score'].round(4).to_numpy()
+    log.info(
+        f"Found {len(df_matches)} fuzzy matches with '{engine}' (score >= {threshold}); "
+        f"{n_pairs} pairs scored in {time.perf_counter() - t0:.2f}s."
+    )
+    return df_matches
+
+def compare_fuzzy_engines(queries: list, mass_index: "MassGovIndex", df_manual: pd.DataFrame, top_k: int = FUZZY_TOP_K) -> pd.DataFrame:
+    """
+    Runs every fuzzy engine on the same unmatched names and logs runtime, pairs scored,
+    coverage (share with a top-1 score >= the engine's threshold) and, against the manual
+    mappings whose target is in the Mass Gov list (the hard cases), recall@1 / recall@k
+    and precision (share of accepted top-1 candidates that are right). Coverage and
+    precision use each engine's own threshold, so they compare like with like.
+    """
+    target_ids = mass_index.fuzzy_targets['normalized_id'].to_numpy()
+    labeled_queries, labeled_targets = [], []
+    for rmv_name, mass_gov_name in zip(df_manual['rmv_name'], df_manual['mass_gov_name']):
+        q, t = normalize_name(rmv_name), normalize_name(mass_gov_name)
+        t_id = mass_index.names.names.get(t) if q and t else -1
+        if t_id >= 0 and t_id in target_ids:
+            labeled_queries.append(q)
+            labeled_targets.append(t_id)
+    labeled_targets = np.array(labeled_targets, dtype=np.int64)
+
+    rows = []
+    for engine, (candidate_fn, _, threshold) in FUZZY_ENGINES.items():
+        t0 = time.perf_counter()
+        cands, n_pairs = candidate_fn(queries, mass_index, top_k)
+        seconds = time.perf_counter() - t0
+        top1 = cands[cands['rank'] == 0]
+
+        recall_1 = recall_k = precision = None
+        if len(labeled_queries):
+            lab, _ = candidate_fn(labeled_queries, mass_index, top_k)
+            hit = target_ids[lab['mass_idx'].to_numpy()] == labeled_targets[lab['query_idx'].to_numpy()]
+            is_top1 = (lab['rank'] == 0).to_numpy()
+            recall_k = lab.loc[hit, 'query_idx'].nunique() / len(labeled_queries)
+            recall_1 = lab.loc[hit & is_top1, 'query_idx'].nunique() / len(labeled_queries)
+            accepted = is_top1 & (lab['score'] >= threshold).to_numpy()
+            precision = (hit & accepted).sum() / accepted.sum() if accepted.any() else None
+
+        rows.append({
+            "engine": engine,
+            "queries": len(queries),
+            "pairs_scored": n_pairs,
+            "seconds": round(seconds, 3),
+            "threshold": threshold,
+            "coverage": round(float((top1['score'] >= threshold).sum()) / max(len(queries), 1), 4),
+            "labeled": len(labeled_queries),
+            "recall@1": None if recall_1 is None else round(recall_1, 4),
+            f"recall@{top_k}": None if recall_k is None else round(recall_k, 4),
+            "precision": None if precision is None else round(float(precision), 4),
+        })
+
+    df_report = pd.DataFrame(rows)
+    log.info(f"Fuzzy engine comparison:\n{df_report.to_string(index=False)}")
+    return df_report
+
 
 # =========================
 # Helpers
@@ -122,29 +586,33 @@ def get_sql_connection():
         )
     return pyodbc.connect(conn_str, autocommit=True)
 
-def find_xls_url() -> str:
-    """Find the 'Massachusetts Licensed Or Approved Companies.xls' link on the page."""
-    log.info(f"Requesting Mass.gov page: {TARGET_PAGE}")
-    r = requests.get(TARGET_PAGE, timeout=60)
+def find_xls_url(source: SourceConfig = MA_SOURCE) -> str:
+    """Find the company list link (e.g. 'Massachusetts Licensed Or Approved Companies.xls') on the page."""
+    log.info(f"Requesting {source.name} page: {source.target_page}")
+    r = requests.get(source.target_page, timeout=60)
     r.raise_for_status()
-    soup = BeautifulSoup(r.text, "lxml")
+    return find_xls_link(r.text, source)
+
+def find_xls_link(html: str, source: SourceConfig = MA_SOURCE) -> str:
+    """Return the absolute URL of the company list link in the page HTML."""
+    soup = BeautifulSoup(html, "lxml")
 
     for a in soup.find_all("a", href=True):
         text = (a.get_text() or "").strip()
         href = a["href"]
-        if XLS_NAME_PATTERN.search(text) or XLS_NAME_PATTERN.search(href):
+        if source.link_pattern.search(text) or source.link_pattern.search(href):
             if href.startswith("//"):
                 href = "https:" + href
             elif href.startswith("/"):
-                href = "https://www.mass.gov" + href
+                href = source.base_url + href
             log.info(f"Found XLS link: {text} -> {href}")
             return href
 
-    raise RuntimeError("Could not find the 'Massachusetts Licensed Or Approved Companies.xls' link.")
+    raise RuntimeError(f"Could not find the {source.name} company list link ({source.link_pattern.pattern}).")
 
-def download_file(url: str) -> bytes:
+def download_file(url: str, session: requests.Session | None = None) -> bytes:
     log.info(f"Downloading file from {url}...")
-    r = requests.get(url, timeout=120)
+    r = (session or requests).get(url, timeout=120)
     r.raise_for_status()
     return r.content
 
@@ -181,22 +649,25 @@ def read_update_date_from_b4(xbytes: bytes):
         
     return None
 
-def detect_header_row(df_raw: pd.DataFrame):
+def detect_header_row(df_raw: pd.DataFrame, expected: set | None = None):
     """Heuristically find the header row index."""
-    expected = {"Company Type", "NAIC #", "Company", "Address", "City", "State", "Zip", "Phone"}
+    expected = set(expected or MA_HEADER_ALIASES)
+    # Sources with fewer than 4 aliases need all of them on the row
+    min_hits = min(4, len(expected))
     scan_rows = min(40, len(df_raw))
     for idx in range(scan_rows):
         row_vals = set(str(x).strip() for x in df_raw.iloc[idx].tolist())
-        if len(expected.intersection(row_vals)) >= 4:
+        if len(expected.intersection(row_vals)) >= min_hits:
             return idx
     return None
 
-def load_table_dataframe(xbytes: bytes) -> pd.DataFrame:
+def load_table_dataframe(xbytes: bytes, header_aliases: dict | None = None) -> pd.DataFrame:
     """Load the data table into a normalized DataFrame."""
     engine = "openpyxl" if is_xlsx(xbytes) else "xlrd"
     
     df_raw = pd.read_excel(io.BytesIO(xbytes), header=None, engine=engine)
-    hdr_idx = detect_header_row(df_raw)
+    rename_map = header_aliases or MA_HEADER_ALIASES
+    hdr_idx = detect_header_row(df_raw, set(rename_map))
     if hdr_idx is None:
         log.warning("Could not detect header row, defaulting to 0.")
         hdr_idx = 0
@@ -204,10 +675,6 @@ def load_table_dataframe(xbytes: bytes) -> pd.DataFrame:
 
     df = pd.read_excel(io.BytesIO(xbytes), header=hdr_idx, engine=engine)
 
-    rename_map = {
-        "Company Type": "company_type", "NAIC #": "naic", "Company": "company",
-        "Address": "address", "City": "city", "State": "state", "Zip": "zip", "Phone": "phone",
-    }
     def norm_col(c):
         c0 = str(c).strip()
         for k, v in rename_map.items():
@@ -217,8 +684,11 @@ def load_table_dataframe(xbytes: bytes) -> pd.DataFrame:
     df.columns = [norm_col(c) for c in df.columns]
 
     keep = ["company_type", "naic", "company", "address", "city", "state", "zip", "phone"]
-    present = [c for c in keep if c in df.columns]
-    df = df[present].copy()
+    missing = [c for c in keep if c not in df.columns]
+    if missing:
+        # Downstream code indexes every canonical column, so lists without one get it empty
+        log.warning(f"List has no column(s) {', '.join(missing)}; loading them as empty.")
+    df = df.reindex(columns=keep)
     
     return df
 
@@ -264,21 +734,47 @@ def clean_and_trim(df: pd.DataFrame) -> pd.DataFrame:
 
 # --- Part 2 (Mapping) SQL Helpers ---
 
-def get_rmv_data(conn) -> pd.DataFrame:
+def get_rmv_data(conn, source: SourceConfig = MA_SOURCE) -> pd.DataFrame:
     """Pulls the RMV carrier list from the source DB."""
     query = f"""
     SELECT [CARRIER_NAME]
-    FROM {RMV_SOURCE_DB}.{RMV_SOURCE_TABLE}
+    FROM {source.carrier_source}
     WHERE [CARRIER_NAME] IS NOT NULL
     """
-    log.info(f"Querying RMV carrier names from {RMV_SOURCE_DB}...")
+    log.info(f"Querying carrier names from {source.carrier_source}...")
     df_rmv = pd.read_sql_query(query, conn)
     log.info(f"Loaded {len(df_rmv)} rows from RMV table.")
     df_rmv = df_rmv.drop_duplicates(subset=['CARRIER_NAME']).reset_index(drop=True)
     log.info(f"Reduced to {len(df_rmv)} unique RMV names.")
     return df_rmv
+
+def iter_rmv_batches(conn, batch_size: int, source: SourceConfig = MA_SOURCE):
+    """
+    Streams the distinct RMV carrier names in DataFrames of at most batch_size rows.
+    DISTINCT runs server-side with a binary collation + byte length, so it keeps
+    exactly the names pandas' drop_duplicates would (case and trailing spaces differ).
+    """
+    query = f"""
+    SELECT DISTINCT
+        [CARRIER_NAME] COLLATE Latin1_General_BIN2 AS CARRIER_NAME,
+        DATALENGTH([CARRIER_NAME]) AS name_bytes
+    FROM {source.carrier_source}
+    WHERE [CARRIER_NAME] IS NOT NULL
+    """
+    log.info(f"Streaming carrier names from {source.carrier_source} in batches of {batch_size}...")
+    n_batches = n_rows = 0
+    with conn.cursor() as cur:
+        cur.execute(query)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            n_batches += 1
+            n_rows += len(rows)
+            yield pd.DataFrame({'CARRIER_NAME': [r[0] for r in rows]})
+    log.info(f"Streamed {n_rows} unique RMV names in {n_batches} batches.")
     
-def apply_hardcoded_matches(df_rmv: pd.DataFrame) -> pd.DataFrame:
+def apply_hardcoded_matches(df_rmv: pd.DataFrame, source: SourceConfig = MA_SOURCE) -> pd.DataFrame:
     """
     Applies the custom override logic to map specific RMV names
     to their known Mass Gov equivalents *before* normalization.
@@ -287,41 +783,38 @@ def apply_hardcoded_matches(df_rmv: pd.DataFrame) -> pd.DataFrame:
     # Default: the match target is the original name
     df_rmv['rmv_match_target'] = df_rmv['CARRIER_NAME']
     
-    # 1. Pattern Match: XXXX(Pilgrim) -> Pilgrim Insurance Company
-    pilgrim_mask = df_rmv['CARRIER_NAME'].str.contains(r'\(Pilgrim\)', na=False, case=False)
-    df_rmv.loc[pilgrim_mask, 'rmv_match_target'] = 'Pilgrim Insurance Company'
-    log.info(f"Mapped {pilgrim_mask.sum()} RMV names to 'Pilgrim Insurance Company'")
-
-    # 2. Exact Name Overrides
-    overrides = {
-        # Original overrides
-        'Privilege Underwriters Reciprocal Exchange (PURE)': 'Privilege Underwriters Reciprocal Exchange',
-        'Metropolitan Property and Casualty Insurance Company': 'Farmers Casualty Insurance Company',
-        'Electric Insurance Company': 'Plymouth Rock Assurance Corporation',
-    
-        'Foremost Insurance Company': 'Foremost Property and Casualty Insurance Company',
-        'Citation Insurance Company, MA': 'Citation Insurance Company',
-        'IDS Property Casualty Insurance Company': 'American Family Connect Insurance Company',
-        'Seaworthy Insurance Company': 'GEICO Marine Insurance Company'
-    }
-    
-    for rmv_name, target_name in overrides.items():
-        override_mask = (df_rmv['CARRIER_NAME'] == rmv_name)
-        df_rmv.loc[override_mask, 'rmv_match_target'] = target_name
-        # Log count for each override
-        count = override_mask.sum()
-        if count > 0:
-            log.info(f"Mapped {count} RMV names from '{rmv_name}' to '{target_name}'")
+    # 1. Pattern Match, e.g. XXXX(Pilgrim) -> Pilgrim Insurance Company
+    for pattern, target in source.pattern_overrides:
+        pattern_mask = df_rmv['CARRIER_NAME'].str.contains(pattern, na=False)
+        df_rmv.loc[pattern_mask, 'rmv_match_target'] = target
+        log.info(f"Mapped {pattern_mask.sum()} RMV names to '{target}'")
+
+    # 2. Exact Name Overrides (one lookup pass instead of one scan per rule)
+    targets = df_rmv['CARRIER_NAME'].map(source.name_overrides)
+    override_mask = targets.notna()
+    df_rmv.loc[override_mask, 'rmv_match_target'] = targets[override_mask]
+    # Log count for each override
+    for rmv_name, count in df_rmv.loc[override_mask, 'CARRIER_NAME'].value_counts().items():
+        log.info(f"Mapped {count} RMV names from '{rmv_name}' to '{source.name_overrides[rmv_name]}'")
         
     return df_rmv
 
-def recreate_mapping_table(conn):
+# Published surrogate IDs. Matching uses run-scoped NameDictionary IDs; before publishing they are
+# replaced by stable IDs from the persistent name dictionary table (assign_stable_name_ids).
+MAPPING_ID_COLS = ["rmv_name_id", "mass_gov_name_id"]
+MAPPING_COLS = (
+    ["rmv_name", "mass_gov_name", "address", "city", "state", "zip", "phone", "update_dt"]
+    + MAPPING_ID_COLS
+    + ["match_method", "match_score"]
+)
+
+def recreate_mapping_table(conn, table: str = SQL_MAPPING_TABLE):
     """Drops and recreates the final mapping table."""
     ddl = f"""
-    IF OBJECT_ID('{SQL_SCHEMA}.{SQL_MAPPING_TABLE}', 'U') IS NOT NULL
-        DROP TABLE {SQL_SCHEMA}.{SQL_MAPPING_TABLE};
+    IF OBJECT_ID('{SQL_SCHEMA}.{table}', 'U') IS NOT NULL
+        DROP TABLE {SQL_SCHEMA}.{table};
 
-    CREATE TABLE {SQL_SCHEMA}.{SQL_MAPPING_TABLE}(
+    CREATE TABLE {SQL_SCHEMA}.{table}(
         rmv_name        VARCHAR(255) NULL,
         mass_gov_name   VARCHAR(255) NULL,
         address         VARCHAR(255) NULL,
@@ -329,179 +822,877 @@ def recreate_mapping_table(conn):
         state           VARCHAR(10)  NULL,
         zip             VARCHAR(20)  NULL,
         phone           VARCHAR(40)  NULL,
-        update_dt       DATE         NULL
+        update_dt       DATE         NULL,
+        rmv_name_id     INT          NULL,
+        mass_gov_name_id INT         NULL,
+        match_method    VARCHAR(32)  NULL,
+        match_score     DECIMAL(6,4) NULL
     );
     """
     with conn.cursor() as cur:
-        log.info(f"Recreating mapping table: {SQL_SCHEMA}.{SQL_MAPPING_TABLE}")
+        log.info(f"Recreating mapping table: {SQL_SCHEMA}.{table}")
         cur.execute(ddl)
-        
-def insert_mapping_dataframe(conn, df: pd.DataFrame):
+
+def swap_in_mapping_table(conn, stage: str, table: str):
+    """
+    Replaces the published table with the fully loaded staging table in one
+    transaction, so readers never see a missing or half-built mapping table.
+    """
+    sql = f"""
+    SET XACT_ABORT ON;
+    BEGIN TRANSACTION;
+        IF OBJECT_ID('{SQL_SCHEMA}.{table}', 'U') IS NOT NULL
+            DROP TABLE {SQL_SCHEMA}.{table};
+        EXEC sp_rename '{SQL_SCHEMA}.{stage}', '{table}';
+    COMMIT TRANSACTION;
+    """
+    with conn.cursor() as cur:
+        cur.execute(sql)
+    log.info(f"Published {SQL_SCHEMA}.{stage} as {SQL_SCHEMA}.{table}.")
+
+def insert_mapping_dataframe(conn, df: pd.DataFrame, table: str = SQL_MAPPING_TABLE):
     """Bulk insert rows into the final mapping table."""
-    cols = ["rmv_name", "mass_gov_name", "address", "city", "state", "zip", "phone", "update_dt"]
+    cols = MAPPING_COLS
     df_insert = df[cols].copy()
+    for c in MAPPING_ID_COLS:
+        # -1 means "no name" (e.g. a manual row without mass_gov_name)
+        df_insert[c] = df_insert[c].astype('Int64').where(df_insert[c] >= 0)
     
-    df_insert = df_insert.where(pd.notnull(df_insert), None)
+    # object dtype so ints/None go to pyodbc as plain Python values
+    df_insert = df_insert.astype(object).where(pd.notnull(df_insert), None)
 
     placeholders = ", ".join(["?"] * len(cols))
-    sql = f"INSERT INTO {SQL_SCHEMA}.{SQL_MAPPING_TABLE} ({', '.join(cols)}) VALUES ({placeholders})"
+    sql = f"INSERT INTO {SQL_SCHEMA}.{table} ({', '.join(cols)}) VALUES ({placeholders})"
 
     with conn.cursor() as cur:
         cur.fast_executemany = True
         cur.executemany(sql, df_insert.values.tolist())
 
-    log.info(f"Inserted {len(df_insert)} rows into {SQL_SCHEMA}.{SQL_MAPPING_TABLE}.")
+    log.info(f"Inserted {len(df_insert)} rows into {SQL_SCHEMA}.{table}.")
+
+# --- Name Dictionary Table (stable published IDs) ---
+
+def ensure_name_dictionary_table(conn, table: str = SQL_NAME_DICTIONARY_TABLE):
+    """
+    Creates the append-only name -> ID table if it does not exist yet (never drops it).
+    Names are keyed on a SHA-256 of their exact text, so 'Foo Ins', 'FOO INS' and
+    'Foo Ins ' each keep their own ID regardless of collation.
+    """
+    ddl = f"""
+    IF OBJECT_ID('{SQL_SCHEMA}.{table}', 'U') IS NULL
+    BEGIN
+        CREATE TABLE {SQL_SCHEMA}.{table}(
+            name_id     INT IDENTITY(1,1) NOT NULL PRIMARY KEY,
+            name        NVARCHAR(400)     NOT NULL,
+            name_hash   BINARY(32)        NOT NULL,
+            add_dt      DATETIME          NOT NULL
+        );
+        CREATE UNIQUE INDEX UX_{table}_name_hash ON {SQL_SCHEMA}.{table}(name_hash);
+    END
+    """
+    with conn.cursor() as cur:
+        cur.execute(ddl)
+
+def assign_stable_name_ids(conn, df: pd.DataFrame, source: SourceConfig = MA_SOURCE) -> pd.DataFrame:
+    """
+    Replaces the run-scoped NameDictionary IDs with IDs from the persistent name
+    dictionary table: known names keep their ID, new names are appended. The same
+    name therefore has the same ID in every run and in streaming or in-memory mode.
+    """
+    table, stage = source.name_dictionary_table, source.name_dictionary_stage_table
+    names = pd.unique(pd.concat([df['rmv_name'], df['mass_gov_name']]).dropna())
+    df = df.copy()
+    if len(names) == 0:
+        df[MAPPING_ID_COLS] = -1
+        return df
+
+    ddl = f"""
+    IF OBJECT_ID('{SQL_SCHEMA}.{stage}', 'U') IS NOT NULL
+        DROP TABLE {SQL_SCHEMA}.{stage};
+
+    CREATE TABLE {SQL_SCHEMA}.{stage}(
+        pos     INT           NOT NULL,
+        name    NVARCHAR(400) NOT NULL
+    );
+    """
+    append = f"""
+    INSERT INTO {SQL_SCHEMA}.{table} (name, name_hash, add_dt)
+    SELECT s.name, HASHBYTES('SHA2_256', s.name), GETDATE()
+    FROM {SQL_SCHEMA}.{stage} AS s
+    WHERE NOT EXISTS (
+        SELECT 1 FROM {SQL_SCHEMA}.{table} AS d WHERE d.name_hash = HASHBYTES('SHA2_256', s.name)
+    );
+    """
+    lookup = f"""
+    SELECT s.pos, d.name_id
+    FROM {SQL_SCHEMA}.{stage} AS s
+    JOIN {SQL_SCHEMA}.{table} AS d ON d.name_hash = HASHBYTES('SHA2_256', s.name);
+    """
+    with conn.cursor() as cur:
+        cur.execute(ddl)
+        cur.fast_executemany = True
+        cur.executemany(
+            f"INSERT INTO {SQL_SCHEMA}.{stage} (pos, name) VALUES (?, ?)",
+            [(i, str(n)) for i, n in enumerate(names)],
+        )
+        cur.execute(append)
+        n_new = cur.rowcount
+        rows = cur.execute(lookup).fetchall()
+        cur.execute(f"DROP TABLE {SQL_SCHEMA}.{stage};")
+
+    ids = {names[pos]: name_id for pos, name_id in rows}
+    for id_col, name_col in zip(MAPPING_ID_COLS, ("rmv_name", "mass_gov_name")):
+        df[id_col] = df[name_col].map(ids).fillna(-1).astype('int64')
+    log.info(f"Resolved {len(names)} names against {SQL_SCHEMA}.{table} ({n_new} new).")
+    return df
+
+# --- Manual Mapping Helpers ---
+
+MANUAL_MAPPING_COLS = ["rmv_name", "mass_gov_name", "address", "city", "state", "zip", "phone"]
+
+def manual_key(names: pd.Series) -> pd.Series:
+    """Case-insensitive key for rmv_name, matching how SQL Server compares the names."""
+    return names.str.upper()
+
+def drop_unusable_manual_rows(df: pd.DataFrame, origin: str) -> pd.DataFrame:
+    """
+    Drops rows without a mass_gov_name (a manual row replaces the automatic match,
+    so a blank target would publish all-NULL address fields), then keeps one row
+    per rmv_name regardless of case (last one wins).
+    """
+    blank = df["mass_gov_name"].isna()
+    if blank.any():
+        log.warning(f"Dropping {int(blank.sum())} manual mappings without a mass_gov_name from {origin}.")
+    df = df[~blank]
+    return df[~manual_key(df["rmv_name"]).duplicated(keep="last")].reset_index(drop=True)
+
+def ensure_manual_mapping_table(conn, table: str = SQL_MANUAL_MAPPING_TABLE):
+    """Creates the manual mapping table if it does not exist yet (never drops it)."""
+    ddl = f"""
+    IF OBJECT_ID('{SQL_SCHEMA}.{table}', 'U') IS NULL
+    CREATE TABLE {SQL_SCHEMA}.{table}(
+        rmv_name        VARCHAR(255) NULL,
+        mass_gov_name   VARCHAR(255) NULL,
+        address         VARCHAR(255) NULL,
+        city            VARCHAR(120) NULL,
+        state           VARCHAR(10)  NULL,
+        zip             VARCHAR(20)  NULL,
+        phone           VARCHAR(40)  NULL,
+        add_dt          DATETIME     NULL
+    );
+    """
+    with conn.cursor() as cur:
+        cur.execute(ddl)
+
+def load_manual_mapping_file(path: str) -> pd.DataFrame:
+    """
+    Reads a CSV or Excel file of manual mappings.
+    Requires 'rmv_name' and 'mass_gov_name' columns; address fields are optional.
+    """
+    log.info(f"Reading manual mappings from {path}")
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".xlsx", ".xls"):
+        df = pd.read_excel(path, dtype=str)
+    else:
+        df = pd.read_csv(path, dtype=str)
+
+    df.columns = [str(c).strip().lower().replace(' ', '_') for c in df.columns]
+    missing = {"rmv_name", "mass_gov_name"} - set(df.columns)
+    if missing:
+        raise RuntimeError(f"Manual mapping file is missing required column(s): {', '.join(sorted(missing))}")
+
+    for c in MANUAL_MAPPING_COLS:
+        if c not in df.columns:
+            df[c] = None
+    df = clean_and_trim(df[MANUAL_MAPPING_COLS])
+    for c in ("rmv_name", "mass_gov_name"):
+        df[c] = df[c].str.slice(0, 255)
+
+    df = drop_unusable_manual_rows(df.dropna(subset=["rmv_name"]), path)
+    log.info(f"Loaded {len(df)} unique manual mappings from file.")
+    return df
+
+def upsert_manual_mappings(conn, df: pd.DataFrame, source: SourceConfig = MA_SOURCE):
+    """
+    Bulk loads the rows into a staging table, then MERGEs them into the
+    manual mapping table in one statement (update on rmv_name, else insert).
+    """
+    table, stage = source.manual_mapping_table, source.manual_stage_table
+    ddl = f"""
+    IF OBJECT_ID('{SQL_SCHEMA}.{stage}', 'U') IS NOT NULL
+        DROP TABLE {SQL_SCHEMA}.{stage};
+
+    CREATE TABLE {SQL_SCHEMA}.{stage}(
+        rmv_name        VARCHAR(255) NOT NULL,
+        mass_gov_name   VARCHAR(255) NULL,
+        address         VARCHAR(255) NULL,
+        city            VARCHAR(120) NULL,
+        state           VARCHAR(10)  NULL,
+        zip             VARCHAR(20)  NULL,
+        phone           VARCHAR(40)  NULL
+    );
+    """
+    merge = f"""
+    MERGE {SQL_SCHEMA}.{table} AS tgt
+    USING {SQL_SCHEMA}.{stage} AS src
+        ON tgt.rmv_name = src.rmv_name
+    WHEN MATCHED THEN UPDATE SET
+        mass_gov_name = src.mass_gov_name,
+        address       = src.address,
+        city          = src.city,
+        state         = src.state,
+        zip           = src.zip,
+        phone         = src.phone
+    WHEN NOT MATCHED BY TARGET THEN
+        INSERT (rmv_name, mass_gov_name, address, city, state, zip, phone, add_dt)
+        VALUES (src.rmv_name, src.mass_gov_name, src.address, src.city, src.state, src.zip, src.phone, GETDATE());
+    """
+    df_insert = df[MANUAL_MAPPING_COLS].copy()
+    df_insert = df_insert.where(pd.notnull(df_insert), None)
+
+    placeholders = ", ".join(["?"] * len(MANUAL_MAPPING_COLS))
+    sql = f"INSERT INTO {SQL_SCHEMA}.{stage} ({', '.join(MANUAL_MAPPING_COLS)}) VALUES ({placeholders})"
+
+    with conn.cursor() as cur:
+        cur.execute(ddl)
+        cur.fast_executemany = True
+        cur.executemany(sql, df_insert.values.tolist())
+        log.info(f"Staged {len(df_insert)} rows in {SQL_SCHEMA}.{stage}.")
+
+        cur.execute(merge)
+        log.info(f"Upserted {cur.rowcount} rows into {SQL_SCHEMA}.{table}.")
+        cur.execute(f"DROP TABLE {SQL_SCHEMA}.{stage};")
+
+def import_manual_mappings(conn, path: str, source: SourceConfig = MA_SOURCE):
+    """Bulk import of a manual mapping file (replaces hand-edited INSERT/UPDATE statements)."""
+    df_manual = load_manual_mapping_file(path)
+    ensure_manual_mapping_table(conn, source.manual_mapping_table)
+    if df_manual.empty:
+        log.warning("Manual mapping file has no usable rows; nothing to import.")
+        return
+    upsert_manual_mappings(conn, df_manual, source)
+
+def get_manual_mappings(conn, table: str = SQL_MANUAL_MAPPING_TABLE) -> pd.DataFrame:
+    """Reads the manual mapping table (one row per rmv_name)."""
+    ensure_manual_mapping_table(conn, table)
+    query = f"""
+    SELECT {', '.join(MANUAL_MAPPING_COLS)}
+    FROM {SQL_SCHEMA}.{table}
+    WHERE rmv_name IS NOT NULL
+    ORDER BY add_dt, rmv_name
+    """
+    df_manual = pd.read_sql_query(query, conn)
+    # Trim so blank strings count as missing; on duplicates the most recently added row wins
+    df_manual[['rmv_name', 'mass_gov_name']] = df_manual[['rmv_name', 'mass_gov_name']].apply(lambda c: c.str.strip().replace('', np.nan))
+    df_manual = drop_unusable_manual_rows(df_manual.dropna(subset=['rmv_name']), f"{SQL_SCHEMA}.{table}")
+    log.info(f"Loaded {len(df_manual)} manual mappings from {SQL_SCHEMA}.{table}.")
+    return df_manual
+
+def apply_manual_mappings(df_mapping: pd.DataFrame, df_manual: pd.DataFrame, names: NameDictionary) -> pd.DataFrame:
+    """
+    Layers manual mappings over the automatic ones: a manual row replaces any
+    automatic row for the same rmv_name (compared case-insensitively), and
+    manual-only names are added.
+    """
+    if df_manual.empty:
+        log.info("No manual mappings to apply.")
+        return df_mapping
+
+    df_manual = df_manual.copy()
+    df_manual['update_dt'] = date.today()
+    df_manual['rmv_name_id'] = names.encode_names(df_manual['rmv_name'])
+    df_manual['mass_gov_name_id'] = names.encode_names(df_manual['mass_gov_name'])
+    df_manual['match_method'] = 'MANUAL'
+    df_manual['match_score'] = 1.0
+
+    overridden_mask = manual_key(df_mapping['rmv_name']).isin(manual_key(df_manual['rmv_name'])).to_numpy()
+    n_overridden = int(overridden_mask.sum())
+    log.info(f"Manual mappings override {n_overridden} automatic rows and add {len(df_manual) - n_overridden} new rows.")
+
+    # Manual first so the layering is obvious when reading the table
+    return pd.concat([df_manual, df_mapping[~overridden_mask]], ignore_index=True)
 
 
 # =========================
-# Main Execution
+# Pipeline Steps
 # =========================
-def main():
-    try:
-        conn = get_sql_connection()
-        log.info(f"Connected to SQL Server: {SQL_SERVER}, DB: {SQL_DATABASE}")
-        
-        # --- PART 1: Download, Clean, and Archive Mass Gov List ---
-        log.info("--- Starting Part 1: Mass Gov Download & Archive ---")
-        xls_url = find_xls_url()
-        file_bytes = download_file(xls_url)
-        
-        # --- 1.1 Save raw file to archive folder ---
-        os.makedirs(ARCHIVE_FOLDER, exist_ok=True)
-        file_ext = ".xlsx" if is_xlsx(file_bytes) else ".xls"
-        archive_filename = f"MA_Licensed_Companies_{date.today().strftime('%Y%m%d')}{file_ext}"
-        archive_path = os.path.join(ARCHIVE_FOLDER, archive_filename)
-        
-        with open(archive_path, 'wb') as f:
-            f.write(file_bytes)
-        log.info(f"Raw file saved for record at {archive_path}")
-
-        # --- 1.2 Load data into DataFrame for Part 2 ---
-        update_dt = read_update_date_from_b4(file_bytes)
-        if update_dt:
-            log.info(f"Update date (from B4): {update_dt.isoformat()}")
-        else:
-            log.warning("Could not read update date from B4.")
+def archive_raw_file(file_bytes: bytes, source: SourceConfig = MA_SOURCE) -> str:
+    """Saves the raw download to the source's archive folder with a date stamp."""
+    os.makedirs(source.archive_folder, exist_ok=True)
+    file_ext = ".xlsx" if is_xlsx(file_bytes) else ".xls"
+    archive_filename = f"{source.archive_prefix}_{date.today().strftime('%Y%m%d')}{file_ext}"
+    archive_path = os.path.join(source.archive_folder, archive_filename)
 
-        df_mass_gov_raw = load_table_dataframe(file_bytes)
-        df_mass_gov_cleaned = clean_and_trim(df_mass_gov_raw)
-        
-        # --- 1.3 Filter for 'Property & Casualty' ---
-        log.info(f"Loaded {len(df_mass_gov_cleaned)} total rows from Mass Gov list.")
-        filter_mask = df_mass_gov_cleaned['company_type'].str.contains(
-            'Property & Casualty', 
-            case=False, 
-            na=False
-        )
-        df_mass_gov = df_mass_gov_cleaned[filter_mask].copy()
-        
-        if len(df_mass_gov) == 0:
-            log.warning("Filter 'Property & Casualty' resulted in 0 companies. Check the string.")
-        
-        log.info(f"--- Part 1: Download & Archive Complete. {len(df_mass_gov)} 'P&C' rows loaded for processing. ---")
+    with open(archive_path, 'wb') as f:
+        f.write(file_bytes)
+    log.info(f"Raw file saved for record at {archive_path}")
+    return archive_path
 
+def load_mass_gov_list(file_bytes: bytes, source: SourceConfig = MA_SOURCE) -> pd.DataFrame:
+    """Parses, cleans and filters the company list workbook (Mass Gov: 'Property & Casualty' rows)."""
+    update_dt = read_update_date_from_b4(file_bytes)
+    if update_dt:
+        log.info(f"Update date (from B4): {update_dt.isoformat()}")
+    else:
+        log.warning("Could not read update date from B4.")
+
+    df_mass_gov_raw = load_table_dataframe(file_bytes, source.header_aliases)
+    df_mass_gov_cleaned = clean_and_trim(df_mass_gov_raw)
+
+    log.info(f"Loaded {len(df_mass_gov_cleaned)} total rows from {source.name} list.")
+    if not source.company_type_filter:
+        return df_mass_gov_cleaned
+
+    filter_mask = df_mass_gov_cleaned['company_type'].str.contains(
+        source.company_type_filter, 
+        case=False, 
+        na=False,
+        regex=False
+    )
+    df_mass_gov = df_mass_gov_cleaned[filter_mask].copy()
+
+    if len(df_mass_gov) == 0:
+        log.warning(f"Filter '{source.company_type_filter}' resulted in 0 companies. Check the string.")
+    return df_mass_gov
+
+def build_mass_gov_index(df_mass_gov: pd.DataFrame) -> MassGovIndex:
+    """Normalizes and interns the Mass Gov names once, so they can be reused across runs."""
+    names = NameDictionary()
+    df_mass_index = df_mass_gov.copy()
+    df_mass_index['normalized_name'] = df_mass_index['company'].apply(normalize_name)
+    df_mass_index['company_id'] = names.encode_names(df_mass_index['company'])
+    df_mass_index['normalized_id'] = names.encode_names(df_mass_index['normalized_name'])
+    df_mass_index['token_set_id'] = names.encode_token_sets(df_mass_index['normalized_name'])
+    return MassGovIndex(df_mass_index, names)
+
+def build_mapping(
+    df_rmv_raw: pd.DataFrame,
+    mass_index: MassGovIndex,
+    names: NameDictionary,
+    fuzzy_engine: str = FUZZY_ENGINE,
+    source: SourceConfig = MA_SOURCE,
+) -> pd.DataFrame:
+    """
+    Runs the multi-pass match and returns one row per matched RMV name.
+    All joins/filters run on integer IDs from `names` (a per-run copy of mass_index.names).
+    With fuzzy_engine set, a 4th pass scores what is still unmatched.
+    """
+    df_mass = mass_index.df
+    df_rmv = df_rmv_raw.copy()
+    df_rmv['rmv_name_id'] = names.encode_names(df_rmv['CARRIER_NAME'])
+
+    # --- Pass 1: Exact Raw Match ---
+    log.info("--- Starting Pass 1: Exact Raw Match ---")
+    df_exact_matches = pd.merge(
+        df_rmv[df_rmv['rmv_name_id'] >= 0],
+        df_mass[df_mass['company_id'] >= 0],
+        left_on='rmv_name_id',
+        right_on='company_id',
+        how='inner',
+        suffixes=('_rmv', '_pass1')
+    )
+    log.info(f"Found {len(df_exact_matches)} exact raw matches (Pass 1).")
+    
+    # RMV names that are now matched (as IDs)
+    matched_ids = df_exact_matches['rmv_name_id'].to_numpy()
+
+    # --- Pass 2: Normalized Match (for unmatched) ---
+    log.info("--- Starting Pass 2: Normalized Match ---")
+    
+    # Get RMV names that *did not* find an exact match
+    df_rmv_unmatched = df_rmv[~np.isin(df_rmv['rmv_name_id'].to_numpy(), matched_ids)].copy()
+    log.info(f"{len(df_rmv_unmatched)} RMV names remaining for normalization.")
+
+    df_normalized_matches = pd.DataFrame()
+    df_token_matches = pd.DataFrame()
+    df_fuzzy_matches = pd.DataFrame()
+    if not df_rmv_unmatched.empty:
+        # Apply Overrides (hardcodes)
+        df_rmv_unmatched = apply_hardcoded_matches(df_rmv_unmatched, source)
+
+        # Normalize the RMV side (Mass Gov side is pre-normalized in the index)
+        log.info("Normalizing remaining names...")
+        df_rmv_unmatched['normalized_name'] = df_rmv_unmatched['rmv_match_target'].apply(normalize_name)
+        df_rmv_unmatched['normalized_id'] = names.encode_names(df_rmv_unmatched['normalized_name'])
         
-        # --- PART 2: Load RMV, Match (Multi-Pass), and Save Mapping Table ---
-        log.info("--- Starting Part 2: RMV Mapping ---")
-        
-        # 2.1 Load RMV Data
-        df_rmv_raw = get_rmv_data(conn)
+        # Prep for merge (drop nulls)
+        df_rmv_norm = df_rmv_unmatched[df_rmv_unmatched['normalized_id'] >= 0]
+        df_mass_norm = df_mass[(df_mass['normalized_id'] >= 0) & (df_mass['company_id'] >= 0)]
         
-        # --- 2.2 Pass 1: Exact Raw Match ---
-        log.info("--- Starting Pass 1: Exact Raw Match ---")
-        df_exact_matches = pd.merge(
-            df_rmv_raw,
-            df_mass_gov,
-            left_on='CARRIER_NAME',
-            right_on='company',
+        # Perform normalized merge
+        log.info("Performing exact match on normalized names...")
+        df_normalized_matches = pd.merge(
+            df_rmv_norm,
+            df_mass_norm,
+            on='normalized_id',
             how='inner',
-            suffixes=('_rmv', '_pass1')
+            suffixes=('_rmv', '_pass2')
         )
-        log.info(f"Found {len(df_exact_matches)} exact raw matches (Pass 1).")
-        
-        # Get list of RMV names that are now matched
-        matched_rmv_names = df_exact_matches['CARRIER_NAME'].unique()
+        log.info(f"Found {len(df_normalized_matches)} normalized matches (Pass 2).")
 
-        # --- 2.3 Pass 2: Normalized Match (for unmatched) ---
-        log.info("--- Starting Pass 2: Normalized Match ---")
-        
-        # Get RMV names that *did not* find an exact match
-        df_rmv_unmatched = df_rmv_raw[~df_rmv_raw['CARRIER_NAME'].isin(matched_rmv_names)].copy()
-        log.info(f"{len(df_rmv_unmatched)} RMV names remaining for normalization.")
-
-        if not df_rmv_unmatched.empty:
-            # 2.3a Apply Overrides (hardcodes)
-            df_rmv_unmatched = apply_hardcoded_matches(df_rmv_unmatched)
-
-            # 2.3b Normalize both sides
-            log.info("Normalizing remaining names...")
-            df_rmv_unmatched['normalized_name'] = df_rmv_unmatched['rmv_match_target'].apply(normalize_name)
-            df_mass_gov['normalized_name'] = df_mass_gov['company'].apply(normalize_name)
-            
-            # Prep for merge (drop nulls)
-            df_rmv_norm = df_rmv_unmatched.dropna(subset=['normalized_name', 'CARRIER_NAME'])
-            df_mass_norm = df_mass_gov.dropna(subset=['normalized_name', 'company'])
-            
-            # 2.3c Perform normalized merge
-            log.info("Performing exact match on normalized names...")
-            df_normalized_matches = pd.merge(
-                df_rmv_norm,
+        # --- Pass 3: Token-Set Match (same words, different order) ---
+        log.info("--- Starting Pass 3: Token-Set Match ---")
+        matched_ids = np.concatenate([matched_ids, df_normalized_matches['rmv_name_id'].to_numpy()])
+        df_rmv_tokens = df_rmv_norm[~np.isin(df_rmv_norm['rmv_name_id'].to_numpy(), matched_ids)].copy()
+        log.info(f"{len(df_rmv_tokens)} RMV names remaining for token-set matching.")
+
+        if not df_rmv_tokens.empty:
+            df_rmv_tokens['token_set_id'] = names.encode_token_sets(df_rmv_tokens['normalized_name'])
+            df_token_matches = pd.merge(
+                df_rmv_tokens,
                 df_mass_norm,
-                on='normalized_name',
+                on='token_set_id',
                 how='inner',
-                suffixes=('_rmv', '_pass2')
+                suffixes=('_rmv', '_pass3')
             )
-            log.info(f"Found {len(df_normalized_matches)} normalized matches (Pass 2).")
-        else:
-            log.info("No RMV names left for normalized matching.")
-            # Create empty DataFrame to avoid errors later
-            df_normalized_matches = pd.DataFrame() 
+        log.info(f"Found {len(df_token_matches)} token-set matches (Pass 3).")
 
-        # --- 2.4 Combine and Construct Final Table ---
-        log.info("Constructing final mapping table...")
-        
-        # Define the columns we want in the final table
-        final_cols = ['CARRIER_NAME', 'company', 'address', 'phone', 'state', 'city', 'zip']
-        
-        # Format Pass 1 results
-        df_final_pass1 = df_exact_matches[final_cols].copy()
+        # --- Pass 4 (optional): Fuzzy Match ---
+        if fuzzy_engine != "none":
+            log.info(f"--- Starting Pass 4: Fuzzy Match ({fuzzy_engine}) ---")
+            matched_ids = np.concatenate([matched_ids, df_token_matches['rmv_name_id'].to_numpy()]) if not df_token_matches.empty else matched_ids
+            df_rmv_fuzzy = df_rmv_norm[~np.isin(df_rmv_norm['rmv_name_id'].to_numpy(), matched_ids)]
+            log.info(f"{len(df_rmv_fuzzy)} RMV names remaining for fuzzy matching.")
+            if not df_rmv_fuzzy.empty:
+                df_fuzzy_matches = match_fuzzy(df_rmv_fuzzy, mass_index, fuzzy_engine)
+    else:
+        log.info("No RMV names left for normalized matching.")
+
+    # --- Combine and Construct Final Table ---
+    log.info("Constructing final mapping table...")
+    
+    # Define the columns we want in the final table
+    final_cols = ['CARRIER_NAME', 'rmv_name_id', 'company', 'company_id', 'address', 'phone', 'state', 'city', 'zip']
+    
+    # Format results per pass (empty frames keep the right columns); deterministic passes score 1.0
+    frames = []
+    for df_pass, method in (
+        (df_exact_matches, 'EXACT'),
+        (df_normalized_matches, 'NORMALIZED'),
+        (df_token_matches, 'TOKEN_SET'),
+    ):
+        df_final_pass = df_pass[final_cols].copy() if not df_pass.empty else pd.DataFrame(columns=final_cols)
+        df_final_pass['match_method'] = method
+        df_final_pass['match_score'] = 1.0
+        frames.append(df_final_pass)
+    if not df_fuzzy_matches.empty:
+        frames.append(df_fuzzy_matches[final_cols + ['match_method', 'match_score']])
         
-        # Format Pass 2 results (if any)
-        if not df_normalized_matches.empty:
-            df_final_pass2 = df_normalized_matches[final_cols].copy()
+    # Combine the results (Pass 1 first)
+    df_mapping_combined = pd.concat(frames, ignore_index=True)
+    log.info(f"Total matches (all passes): {len(df_mapping_combined)}")
+
+    # Rename columns
+    df_mapping_combined.rename(columns={
+        'CARRIER_NAME': 'rmv_name',
+        'company': 'mass_gov_name',
+        'company_id': 'mass_gov_name_id'
+    }, inplace=True)
+    df_mapping_combined[MAPPING_ID_COLS] = df_mapping_combined[MAPPING_ID_COLS].astype('int64')
+    
+    # Add update_dt
+    df_mapping_combined['update_dt'] = date.today()
+    
+    # Critical: Drop duplicates *after* combining.
+    # By using keep='first', we prioritize the Pass 1 (exact) matches.
+    df_mapping_final = df_mapping_combined.drop_duplicates(subset=['rmv_name_id'], keep='first').copy()
+    log.info(f"Final mapping table has {len(df_mapping_final)} unique RMV mappings.")
+
+    # --- Override naming rule for pattern rows, e.g. (Pilgrim) ---
+    # Keep the original RMV name as mass_gov_name, but retain the target's address info.
+    for pattern, target in source.pattern_overrides:
+        pattern_mask_final = df_mapping_final['rmv_name'].str.contains(pattern, na=False)
+        df_mapping_final.loc[pattern_mask_final, 'mass_gov_name'] = df_mapping_final.loc[pattern_mask_final, 'rmv_name']
+        df_mapping_final.loc[pattern_mask_final, 'mass_gov_name_id'] = df_mapping_final.loc[pattern_mask_final, 'rmv_name_id']
+        log.info(f"Adjusted {pattern_mask_final.sum()} '{pattern.pattern}' rows to keep RMV name as Mass Gov name while retaining {target}'s address.")
+
+    return df_mapping_final
+
+def map_rmv_batches(
+    batches,
+    mass_index: MassGovIndex,
+    df_manual: pd.DataFrame,
+    fuzzy_engine: str = FUZZY_ENGINE,
+    source: SourceConfig = MA_SOURCE,
+):
+    """
+    Generator stage of the streaming mode: matches each RMV batch against the
+    in-memory Mass Gov index and yields its mapping rows (manual layer applied),
+    then any manual rows whose rmv_name never appeared in the feed.
+    Per-name matching is independent of other names, so the union of the batches
+    is identical to build_mapping + apply_manual_mappings over the full list.
+    """
+    # Manual names can repeat across batches (and are not in the index), so intern them
+    # once up front: every batch copy then gives them the same ID
+    base_names = mass_index.names.copy()
+    base_names.encode_names(df_manual['rmv_name'])
+    base_names.encode_names(df_manual['mass_gov_name'])
+    next_name_id = base_names.names.next_id
+    manual_seen = np.zeros(len(df_manual), dtype=bool)
+
+    for df_rmv_batch in batches:
+        # Fresh copy per batch keeps memory bounded; IDs keep counting so they stay unique
+        names = base_names.copy(next_name_id)
+        df_batch_mapping = build_mapping(df_rmv_batch, mass_index, names, fuzzy_engine, source)
+
+        # Case variants of one name ('FOO INS', 'Foo Ins') can land in different batches: every
+        # batch drops the automatic rows a manual row overrides, but each manual row is emitted once
+        in_batch = manual_key(df_manual['rmv_name']).isin(manual_key(df_rmv_batch['CARRIER_NAME'])).to_numpy()
+        overridden = manual_key(df_batch_mapping['rmv_name']).isin(manual_key(df_manual.loc[in_batch, 'rmv_name']))
+        df_batch_mapping = df_batch_mapping[~overridden.to_numpy()]
+        df_batch_mapping = apply_manual_mappings(df_batch_mapping, df_manual[in_batch & ~manual_seen], names)
+        manual_seen |= in_batch
+        next_name_id = names.names.next_id
+        yield df_batch_mapping
+
+    df_manual_only = df_manual[~manual_seen]
+    if not df_manual_only.empty:
+        names = base_names.copy(next_name_id)
+        yield apply_manual_mappings(pd.DataFrame(columns=MAPPING_COLS), df_manual_only, names)
+
+def run_mapping(
+    conn,
+    mass_index: MassGovIndex,
+    batch_size: int = RMV_STREAM_BATCH_SIZE,
+    fuzzy_engine: str = FUZZY_ENGINE,
+    compare_engines: bool = False,
+    source: SourceConfig = MA_SOURCE,
+) -> int:
+    """
+    Part 2: load RMV, match, layer manual rows, rebuild the mapping table. Returns rows published.
+    With batch_size > 0 the RMV feed is streamed through map_rmv_batches instead of loaded whole.
+    """
+    if batch_size and batch_size > 0:
+        if compare_engines:
+            log.warning("--compare-engines is only available for in-memory runs; skipping the comparison.")
+        return run_mapping_streaming(conn, mass_index, batch_size, fuzzy_engine, source)
+
+    log.info("--- Starting Part 2: RMV Mapping ---")
+    # Per-run copy, so RMV names never accumulate in the (possibly warm) Mass Gov index
+    names = mass_index.names.copy()
+
+    df_rmv_raw = get_rmv_data(conn, source)
+    df_mapping_final = build_mapping(df_rmv_raw, mass_index, names, fuzzy_engine, source)
+
+    # Layer manual mappings on top (highest priority)
+    df_manual = get_manual_mappings(conn, source.manual_mapping_table)
+    if compare_engines:
+        # Same input for every engine: names the deterministic passes could not match
+        deterministic = df_mapping_final.loc[~df_mapping_final['match_method'].str.startswith('FUZZY'), 'rmv_name']
+        unmatched = df_rmv_raw.loc[~df_rmv_raw['CARRIER_NAME'].isin(deterministic), 'CARRIER_NAME']
+        queries = [q for q in apply_hardcoded_matches(unmatched.to_frame(), source)['rmv_match_target'].map(normalize_name) if q]
+        compare_fuzzy_engines(queries, mass_index, df_manual)
+    df_mapping_final = apply_manual_mappings(df_mapping_final, df_manual, names)
+
+    ensure_name_dictionary_table(conn, source.name_dictionary_table)
+    df_mapping_final = assign_stable_name_ids(conn, df_mapping_final, source)
+    recreate_mapping_table(conn, source.mapping_stage_table)
+    insert_mapping_dataframe(conn, df_mapping_final, source.mapping_stage_table)
+    swap_in_mapping_table(conn, source.mapping_stage_table, source.mapping_table)
+    log.info("--- Part 2: RMV Mapping Complete ---")
+    log.info(f"Name dictionary: {len(names.names)} names, {len(names.tokens)} tokens, {len(names.token_sets)} token sets.")
+    return len(df_mapping_final)
+
+def run_mapping_streaming(
+    conn,
+    mass_index: MassGovIndex,
+    batch_size: int,
+    fuzzy_engine: str = FUZZY_ENGINE,
+    source: SourceConfig = MA_SOURCE,
+) -> int:
+    """Streaming Part 2: RMV batches -> match -> insert, holding one batch in memory at a time."""
+    log.info(f"--- Starting Part 2: RMV Mapping (streaming, batch size {batch_size}) ---")
+    df_manual = get_manual_mappings(conn, source.manual_mapping_table)
+    # Stream into a staging table; the published table stays intact until the swap at the end
+    ensure_name_dictionary_table(conn, source.name_dictionary_table)
+    recreate_mapping_table(conn, source.mapping_stage_table)
+
+    # Separate connection for the open read cursor, since conn is busy with the inserts
+    reader = get_sql_connection()
+    total = 0
+    try:
+        batches = iter_rmv_batches(reader, batch_size, source)
+        for df_batch_mapping in map_rmv_batches(batches, mass_index, df_manual, fuzzy_engine, source):
+            df_batch_mapping = assign_stable_name_ids(conn, df_batch_mapping, source)
+            insert_mapping_dataframe(conn, df_batch_mapping, source.mapping_stage_table)
+            total += len(df_batch_mapping)
+    finally:
+        reader.close()
+
+    swap_in_mapping_table(conn, source.mapping_stage_table, source.mapping_table)
+    log.info(f"--- Part 2: RMV Mapping Complete ({total} rows streamed) ---")
+    return total
+
+# =========================
+# Daemon Mode
+# =========================
+class WarmState:
+    """What the daemon keeps between polls: connection, HTTP session, Mass Gov index and metrics."""
+
+    def __init__(self, source: SourceConfig = MA_SOURCE):
+        self.source = source
+        self.conn = None
+        self.session = requests.Session()
+        self.page_validators = {}    # conditional-GET headers for source.target_page
+        self.xls_url = None
+        # (url, ETag, Last-Modified, Content-Length) and SHA-256 of the workbook behind the
+        # last *published* run; a freshly indexed workbook waits in pending_file until then
+        self.file_validators = None
+        self.file_hash = None
+        self.pending_file = None
+        self.mass_index = None
+        self.input_signature = None  # RMV + manual table checksums at the last published run
+        self.lock = threading.Lock()
+        self.metrics = {
+            "status": "starting",
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "polls": 0,
+            "runs": 0,
+            "skipped_polls": 0,
+            "failures": 0,
+            "last_poll_at": None,
+            "last_poll_seconds": None,
+            "last_run_at": None,
+            "last_run_seconds": None,
+            "last_run_rows": None,
+            "last_run_reason": None,
+            "last_error": None,
+            "mass_gov_rows": None,
+            "xls_url": None,
+        }
+
+    def update_metrics(self, **kwargs):
+        with self.lock:
+            self.metrics.update(kwargs)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return dict(self.metrics)
+
+def get_pooled_connection(state: WarmState):
+    """Reuses the daemon's connection, reconnecting only if it has gone stale."""
+    if state.conn is not None:
+        try:
+            state.conn.cursor().execute("SELECT 1").fetchone()
+            return state.conn
+        except pyodbc.Error as e:
+            log.warning(f"Pooled SQL connection is stale, reconnecting: {e}")
+            try:
+                state.conn.close()
+            except pyodbc.Error:
+                pass
+            state.conn = None
+
+    state.conn = get_sql_connection()
+    log.info(f"Connected to SQL Server: {SQL_SERVER}, DB: {SQL_DATABASE}")
+    return state.conn
+
+def _row_hash_sql(columns: list) -> str:
+    """
+    SQL expression hashing the exact bytes of a row (SHA-256), so case and
+    trailing-space edits change the fingerprint; CHECKSUM would follow the
+    case-insensitive column collation and miss them. NULL and '' hash differently.
+    """
+    parts = " + NCHAR(31) + ".join(f"ISNULL(CONVERT(NVARCHAR(4000), [{c}], 126), NCHAR(0))" for c in columns)
+    return f"HASHBYTES('SHA2_256', {parts})"
+
+def get_input_signature(conn, source: SourceConfig = MA_SOURCE) -> tuple:
+    """Cheap server-side fingerprint of the RMV and manual tables, used to skip unchanged runs."""
+    ensure_manual_mapping_table(conn, source.manual_mapping_table)
+    rmv_hash = _row_hash_sql(["CARRIER_NAME"])
+    manual_hash = _row_hash_sql(MANUAL_MAPPING_COLS + ["add_dt"])
+    query = f"""
+    SELECT
+        (SELECT COUNT_BIG(*) FROM {source.carrier_source} WHERE [CARRIER_NAME] IS NOT NULL),
+        (SELECT CHECKSUM_AGG(BINARY_CHECKSUM({rmv_hash})) FROM {source.carrier_source} WHERE [CARRIER_NAME] IS NOT NULL),
+        (SELECT COUNT_BIG(*) FROM {SQL_SCHEMA}.{source.manual_mapping_table}),
+        (SELECT CHECKSUM_AGG(BINARY_CHECKSUM({manual_hash})) FROM {SQL_SCHEMA}.{source.manual_mapping_table})
+    """
+    with conn.cursor() as cur:
+        return tuple(cur.execute(query).fetchone())
+
+def refresh_mass_gov_index(state: WarmState) -> bool:
+    """
+    Polls the source page with conditional requests and only downloads/re-indexes
+    the workbook when it actually changed. Returns True if the index was rebuilt.
+    """
+    source = state.source
+    r = state.session.get(source.target_page, headers=state.page_validators, timeout=60)
+    if r.status_code == 304 and state.xls_url:
+        xls_url = state.xls_url
+    else:
+        r.raise_for_status()
+        xls_url = find_xls_link(r.text, source)
+        state.page_validators = {}
+        if r.headers.get("ETag"):
+            state.page_validators["If-None-Match"] = r.headers["ETag"]
+        if r.headers.get("Last-Modified"):
+            state.page_validators["If-Modified-Since"] = r.headers["Last-Modified"]
+
+    state.xls_url = xls_url
+
+    h = state.session.head(xls_url, allow_redirects=True, timeout=60)
+    h.raise_for_status()
+    validators = (xls_url, h.headers.get("ETag"), h.headers.get("Last-Modified"), h.headers.get("Content-Length"))
+    if (
+        state.mass_index is not None
+        and state.pending_file is None
+        and any(validators[1:])
+        and validators == state.file_validators
+    ):
+        return False
+
+    # Compared against the last *published* workbook, so a failed run is retried with it
+    file_bytes = download_file(xls_url, state.session)
+    file_hash = hashlib.sha256(file_bytes).hexdigest()
+    if state.mass_index is not None and state.pending_file is None and file_hash == state.file_hash:
+        log.info("Mass Gov workbook re-downloaded but content is unchanged.")
+        state.file_validators = validators
+        return False
+
+    archive_raw_file(file_bytes, source)
+    state.mass_index = build_mass_gov_index(load_mass_gov_list(file_bytes, source))
+    state.pending_file = (validators, file_hash)
+    state.update_metrics(mass_gov_rows=len(state.mass_index), xls_url=xls_url)
+    log.info(f"Mass Gov index rebuilt: {len(state.mass_index)} 'P&C' rows.")
+    return True
+
+def poll_once(state: WarmState, batch_size: int = RMV_STREAM_BATCH_SIZE, fuzzy_engine: str = FUZZY_ENGINE):
+    """One daemon tick: check both inputs, run the mapping only if either changed."""
+    poll_start = time.perf_counter()
+    state.update_metrics(last_poll_at=datetime.now().isoformat(timespec="seconds"))
+    try:
+        conn = get_pooled_connection(state)
+        source_changed = refresh_mass_gov_index(state)
+        input_signature = get_input_signature(conn, state.source)
+        inputs_changed = input_signature != state.input_signature
+
+        if not source_changed and not inputs_changed:
+            log.info("No change in Mass Gov list or RMV/manual tables; skipping run.")
+            with state.lock:
+                state.metrics["skipped_polls"] += 1
         else:
-            df_final_pass2 = pd.DataFrame(columns=final_cols) # Empty df with correct columns
-            
-        # Combine the results (Pass 1 first)
-        df_mapping_combined = pd.concat([df_final_pass1, df_final_pass2], ignore_index=True)
-        log.info(f"Total matches (Pass 1 + Pass 2): {len(df_mapping_combined)}")
-
-        # Rename columns
-        df_mapping_combined.rename(columns={
-            'CARRIER_NAME': 'rmv_name',
-            'company': 'mass_gov_name'
-        }, inplace=True)
-        
-        # Add update_dt
-        df_mapping_combined['update_dt'] = date.today()
-        
-        # Critical: Drop duplicates *after* combining.
-        # By using keep='first', we prioritize the Pass 1 (exact) matches.
-        df_mapping_final = df_mapping_combined.drop_duplicates(subset=['rmv_name'], keep='first')
-        log.info(f"Final mapping table has {len(df_mapping_final)} unique RMV mappings.")
+            reason = ", ".join(r for r, changed in (("mass_gov", source_changed), ("rmv/manual", inputs_changed)) if changed)
+            log.info(f"Inputs changed ({reason}); running mapping.")
+            run_start = time.perf_counter()
+            rows = run_mapping(conn, state.mass_index, batch_size, fuzzy_engine, source=state.source)
+            # Only a published run moves the change-detection markers forward
+            state.input_signature = input_signature
+            if state.pending_file:
+                state.file_validators, state.file_hash = state.pending_file
+                state.pending_file = None
+            with state.lock:
+                state.metrics["runs"] += 1
+            state.update_metrics(
+                last_run_at=datetime.now().isoformat(timespec="seconds"),
+                last_run_seconds=round(time.perf_counter() - run_start, 3),
+                last_run_rows=rows,
+                last_run_reason=reason,
+            )
+        state.update_metrics(status="ok", last_error=None)
+    except Exception as e:
+        log.exception(f"Daemon poll failed: {e}")
+        with state.lock:
+            state.metrics["failures"] += 1
+        state.update_metrics(status="failing", last_error=str(e))
+        # The mapping table may be missing or partial: force a run on the next poll
+        state.input_signature = None
+        # Force a fresh connection on the next poll
+        if state.conn is not None:
+            try:
+                state.conn.close()
+            except pyodbc.Error:
+                pass
+            state.conn = None
+    finally:
+        with state.lock:
+            state.metrics["polls"] += 1
+        state.update_metrics(last_poll_seconds=round(time.perf_counter() - poll_start, 3))
 
-        # --- Override naming rule for (Pilgrim) rows ---
-        # Keep the original RMV name as mass_gov_name, but retain Pilgrim's address info.
-        pilgrim_mask_final = df_mapping_final['rmv_name'].str.contains(r'\(Pilgrim\)', case=False, na=False)
-        df_mapping_final.loc[pilgrim_mask_final, 'mass_gov_name'] = df_mapping_final.loc[pilgrim_mask_final, 'rmv_name']
-        log.info(f"Adjusted {pilgrim_mask_final.sum()} '(Pilgrim)' rows to keep RMV name as Mass Gov name while retaining Pilgrim address.")
+def start_health_server(state: WarmState, host: str, port: int) -> ThreadingHTTPServer:
+    """Serves the daemon metrics as JSON on /health (503 while the last poll is failing)."""
+
+    class HealthHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0].rstrip("/") not in ("", "/health"):
+                self.send_error(404)
+                return
+            metrics = state.snapshot()
+            body = json.dumps(metrics, default=str).encode("utf-8")
+            self.send_response(503 if metrics["status"] == "failing" else 200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            log.debug(f"health: {format % args}")
+
+    server = ThreadingHTTPServer((host, port), HealthHandler)
+    threading.Thread(target=server.serve_forever, name="health-server", daemon=True).start()
+    log.info(f"Health endpoint listening on http://{host}:{port}/health")
+    return server
+
+def run_daemon(
+    manual_file: str | None = MANUAL_MAPPING_FILE,
+    poll_seconds: int = DAEMON_POLL_SECONDS,
+    batch_size: int = RMV_STREAM_BATCH_SIZE,
+    fuzzy_engine: str = FUZZY_ENGINE,
+):
+    """Long-running mode: keeps everything warm and re-runs the mapping only when inputs change."""
+    state = WarmState()
+    server = start_health_server(state, DAEMON_HEALTH_HOST, DAEMON_HEALTH_PORT) if DAEMON_HEALTH_PORT else None
+    log.info(f"Starting daemon mode (poll every {poll_seconds}s).")
+    try:
+        if manual_file:
+            log.info("--- Starting Part 0: Manual Mapping Import ---")
+            import_manual_mappings(get_pooled_connection(state), manual_file)
 
+        while True:
+            next_poll = time.monotonic() + poll_seconds
+            poll_once(state, batch_size, fuzzy_engine)
+            time.sleep(max(0.0, next_poll - time.monotonic()))
+    except KeyboardInterrupt:
+        log.info("Daemon stopped.")
+    finally:
+        if server:
+            server.shutdown()
+        state.session.close()
+        if state.conn is not None:
+            state.conn.close()
+            log.info("SQL Connection closed.")
+
+
+# =========================
+# Main Execution
+# =========================
+def main(
+    manual_file: str | None = MANUAL_MAPPING_FILE,
+    batch_size: int = RMV_STREAM_BATCH_SIZE,
+    fuzzy_engine: str = FUZZY_ENGINE,
+    compare_engines: bool = False,
+    source: SourceConfig = MA_SOURCE,
+):
+    try:
+        conn = get_sql_connection()
+        log.info(f"Connected to SQL Server: {SQL_SERVER}, DB: {SQL_DATABASE}")
+
+        # --- PART 0 (optional): Bulk import manual mappings ---
+        if manual_file:
+            log.info("--- Starting Part 0: Manual Mapping Import ---")
+            import_manual_mappings(conn, manual_file, source)
         
+        # --- PART 1: Download, Clean, and Archive Mass Gov List ---
+        log.info("--- Starting Part 1: Mass Gov Download & Archive ---")
+        xls_url = find_xls_url(source)
+        file_bytes = download_file(xls_url)
+        archive_raw_file(file_bytes, source)
 
-        # --- 2.5 Save to SQL ---
-        recreate_mapping_table(conn)
-        insert_mapping_dataframe(conn, df_mapping_final)
-        log.info("--- Part 2: RMV Mapping Complete ---")
+        mass_index = build_mass_gov_index(load_mass_gov_list(file_bytes, source))
+        log.info(f"--- Part 1: Download & Archive Complete. {len(mass_index)} 'P&C' rows loaded for processing. ---")
+
+        # --- PART 2: Load RMV, Match (Multi-Pass), and Save Mapping Table ---
+        run_mapping(conn, mass_index, batch_size, fuzzy_engine, compare_engines, source)
 
         log.info("All done ✅")
 
@@ -516,4 +1707,52 @@ def main():
 if __name__ == "__main__":
     # --- Dependencies needed ---
     # pip install pandas requests pyodbc beautifulsoup4 lxml openpyxl xlrd==1.2.0 python-dateutil
-    main()
+    parser = argparse.ArgumentParser(description="Build the MA 2A Form RMV -> Mass Gov mapping table.")
+    parser.add_argument(
+        "--manual-file",
+        default=MANUAL_MAPPING_FILE,
+        help=f"CSV/XLSX of manual mappings to upsert into {SQL_MANUAL_MAPPING_TABLE} before mapping (env: MANUAL_MAPPING_FILE)",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Run as a long-lived service that polls for changes instead of a single run",
+    )
+    parser.add_argument(
+        "--poll-seconds",
+        type=int,
+        default=DAEMON_POLL_SECONDS,
+        help="Daemon poll interval in seconds (env: DAEMON_POLL_SECONDS)",
+    )
+    parser.add_argument(
+        "--stream-batch-size",
+        type=int,
+        default=RMV_STREAM_BATCH_SIZE,
+        help="Stream RMV names in batches of this size (0 = load all in memory; env: RMV_STREAM_BATCH_SIZE)",
+    )
+    parser.add_argument(
+        "--fuzzy-engine",
+        choices=["none", *FUZZY_ENGINES],
+        default=FUZZY_ENGINE,
+        help="Fuzzy pass for names the exact/normalized/token-set passes miss (env: FUZZY_ENGINE)",
+    )
+    parser.add_argument(
+        "--compare-engines",
+        action="store_true",
+        help="Log runtime, coverage and recall of every fuzzy engine on this run's unmatched names",
+    )
+    args = parser.parse_args()
+    if args.daemon:
+        run_daemon(
+            manual_file=args.manual_file,
+            poll_seconds=args.poll_seconds,
+            batch_size=args.stream_batch_size,
+            fuzzy_engine=args.fuzzy_engine,
+        )
+    else:
+        main(
+            manual_file=args.manual_file,
+            batch_size=args.stream_batch_size,
+            fuzzy_engine=args.fuzzy_engine,
+            compare_engines=args.compare_engines,
+        )
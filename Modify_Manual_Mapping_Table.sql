@@ -1,3 +1,7 @@
+-- For more than a row or two, prefer the bulk import instead of editing this file:
+--   python MA_Address_Mapping_V2.py --manual-file manual_fixes.csv
+-- (columns: rmv_name, mass_gov_name, address, city, state, zip, phone; upserts on rmv_name)
+
 
 
 --ADD NEW ROWS
@@ -0,0 +1,158 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from MA_Address_Mapping_V2 import (
+    FUZZY_ENGINE,
+    FUZZY_ENGINES,
+    MA_SOURCE,
+    RMV_STREAM_BATCH_SIZE,
+    SourceConfig,
+    archive_raw_file,
+    build_mass_gov_index,
+    download_file,
+    find_xls_url,
+    get_sql_connection,
+    load_mass_gov_list,
+    run_mapping,
+)
+
+# =========================
+# Config (override via ENV)
+# =========================
+# Optional JSON file with a list of extra sources (SourceConfig.from_dict); an entry named "MA" replaces the built-in one
+SOURCES_CONFIG = os.getenv("SOURCES_CONFIG")
+# Worker processes; 0 = one per source
+SOURCE_WORKERS = int(os.getenv("SOURCE_WORKERS", "0"))
+
+log = logging.getLogger("Multi_State_Mapping_Runner")
+
+def load_sources(path: str | None = SOURCES_CONFIG) -> dict:
+    """Built-in MA source plus any sources defined in the JSON config, keyed by name."""
+    sources = {MA_SOURCE.name: MA_SOURCE}
+    if path:
+        with open(path, encoding="utf-8") as f:
+            for entry in json.load(f):
+                source = SourceConfig.from_dict(entry)
+                sources[source.name] = source
+        log.info(f"Loaded {len(sources)} sources ({', '.join(sources)}) from {path}.")
+    return sources
+
+def run_source(source: SourceConfig, batch_size: int, fuzzy_engine: str) -> dict:
+    """
+    Runs Part 1 + Part 2 for one source inside a worker process and returns its telemetry.
+    Never raises: failures are reported in the returned dict so other sources keep running.
+    """
+    # Tag every line with the source, since workers share stdout
+    for handler in logging.getLogger().handlers:
+        handler.setFormatter(logging.Formatter(f"%(asctime)s | %(levelname)s | {source.name} | %(message)s"))
+
+    telemetry = {
+        "source": source.name,
+        "pid": os.getpid(),
+        "status": "ok",
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "stage_seconds": {},
+        "list_rows": None,
+        "mapping_rows": None,
+        "error": None,
+    }
+    stage_seconds = telemetry["stage_seconds"]
+    conn = None
+    stage = "connect"
+    start = time.perf_counter()
+    try:
+        t = time.perf_counter()
+        conn = get_sql_connection()
+        stage_seconds[stage] = round(time.perf_counter() - t, 3)
+
+        stage = "download"
+        t = time.perf_counter()
+        file_bytes = download_file(find_xls_url(source))
+        archive_raw_file(file_bytes, source)
+        stage_seconds[stage] = round(time.perf_counter() - t, 3)
+
+        stage = "index"
+        t = time.perf_counter()
+        mass_index = build_mass_gov_index(load_mass_gov_list(file_bytes, source))
+        telemetry["list_rows"] = len(mass_index)
+        stage_seconds[stage] = round(time.perf_counter() - t, 3)
+
+        stage = "mapping"
+        t = time.perf_counter()
+        telemetry["mapping_rows"] = run_mapping(conn, mass_index, batch_size, fuzzy_engine, source=source)
+        stage_seconds[stage] = round(time.perf_counter() - t, 3)
+    except Exception as e:
+        log.exception(f"{source.name} failed during {stage}: {e}")
+        telemetry.update(status="failed", error=f"{stage}: {e}")
+    finally:
+        if conn is not None:
+            conn.close()
+        telemetry["total_seconds"] = round(time.perf_counter() - start, 3)
+    return telemetry
+
+def run_sources(sources: list, batch_size: int, fuzzy_engine: str, workers: int = SOURCE_WORKERS) -> list:
+    """Runs every source in its own worker process; returns telemetry in completion order."""
+    workers = workers or len(sources)
+    log.info(f"Running {len(sources)} sources ({', '.join(s.name for s in sources)}) on {workers} worker processes.")
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_source, s, batch_size, fuzzy_engine): s.name for s in sources}
+        for future in as_completed(futures):
+            try:
+                telemetry = future.result()
+            except Exception as e:  # worker died (e.g. killed / unpicklable result)
+                telemetry = {"source": futures[future], "status": "failed", "error": str(e), "stage_seconds": {}}
+            log.info(
+                f"{telemetry['source']}: {telemetry['status']} in {telemetry.get('total_seconds')}s "
+                f"(stages {telemetry['stage_seconds']}, list rows {telemetry.get('list_rows')}, "
+                f"mapping rows {telemetry.get('mapping_rows')})"
+            )
+            results.append(telemetry)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the 2A Form mapping pipeline for several states in parallel.")
+    parser.add_argument(
+        "--sources",
+        help="Comma-separated source names to run (default: all configured sources)",
+    )
+    parser.add_argument(
+        "--stream-batch-size",
+        type=int,
+        default=RMV_STREAM_BATCH_SIZE,
+        help="Stream RMV names in batches of this size (0 = load all in memory; env: RMV_STREAM_BATCH_SIZE)",
+    )
+    parser.add_argument(
+        "--fuzzy-engine",
+        choices=["none", *FUZZY_ENGINES],
+        default=FUZZY_ENGINE,
+        help="Fuzzy pass for names the exact/normalized/token-set passes miss (env: FUZZY_ENGINE)",
+    )
+    parser.add_argument(
+        "--telemetry-file",
+        help="Also write the per-source telemetry as JSON to this path",
+    )
+    args = parser.parse_args()
+
+    all_sources = load_sources()
+    names = [n.strip() for n in args.sources.split(",") if n.strip()] if args.sources else list(all_sources)
+    unknown = [n for n in names if n not in all_sources]
+    if unknown:
+        parser.error(f"Unknown source(s): {', '.join(unknown)}. Configured: {', '.join(all_sources)}")
+
+    results = run_sources([all_sources[n] for n in names], args.stream_batch_size, args.fuzzy_engine)
+    if args.telemetry_file:
+        with open(args.telemetry_file, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    failed = [r["source"] for r in results if r["status"] != "ok"]
+    if failed:
+        log.error(f"Failed sources: {', '.join(failed)}")
+        sys.exit(1)
+    log.info("All sources done ✅")